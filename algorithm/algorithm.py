@@ -1,9 +1,16 @@
 """Algorithm Module for Cats App"""
 
+import hashlib
+import json
+import os
 from abc import abstractmethod
+from time import perf_counter
 
+import numpy as np
 import taichi as ti
 
+from algorithm.hashing import hash_uniform, pcg_hash
+
 
 class BasicState:
     WALK = 1
@@ -17,6 +24,34 @@ class DistanceFunction:
     CHEBYSHEV = 2
 
 
+# compiled kernels are kept here between runs
+TAICHI_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cats", "ticache")
+# cell sizes chosen by tune_cell_size() for every configuration
+GRID_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cats", "grid.json")
+# candidate cell sizes of the tuner, in search radii (max(R0, R1))
+CELL_SIZE_FACTORS = (0.5, 1, 2, 4)
+
+# arch of the last init_taichi() call, cell sizes are tuned per arch
+_taichi_arch = None
+
+
+def init_taichi(arch=ti.cpu, cache_dir: str | None = TAICHI_CACHE_DIR, **kwargs):
+    """
+    ti.init() with the offline cache of compiled kernels in `cache_dir`
+    (None disables it).
+
+    Kernels compiled by a process get into the cache on ti.reset() or exit.
+    """
+    global _taichi_arch
+    _taichi_arch = arch
+    if cache_dir is None:
+        ti.init(arch=arch, offline_cache=False, **kwargs)
+    else:
+        ti.init(
+            arch=arch, offline_cache=True, offline_cache_file_path=cache_dir, **kwargs
+        )
+
+
 class AbstractAlgo:
     """An algorithm that processes cats and returns their states."""
 
@@ -25,8 +60,35 @@ class AbstractAlgo:
         pass
 
     @abstractmethod
-    def get_states(self, cat_pos, out_states):
-        """Process cats and return their states."""
+    def get_states(self, cat_pos, out_states, frame=None):
+        """Process cats and return their states.
+
+        Random decisions depend only on the seed and the frame number.
+        """
+        pass
+
+    def get_states_batch(self, cat_pos, out_states, first_frame=None):
+        """Process a stack of frames: cat_pos (K, 2, N), out_states (K, N)."""
+        for k, (frame_pos, frame_states) in enumerate(zip(cat_pos, out_states)):
+            frame = None if first_frame is None else first_frame + k
+            self.get_states(frame_pos, frame_states, frame)
+
+    def warm_up(self, coords_dtype=int, states_dtype=int):
+        """Prepare (e.g. compile) everything the first frame needs. Call after start()."""
+        pass
+
+    def destroy(self):
+        """Free resources (e.g. Taichi fields) allocated by start()."""
+        pass
+
+    @abstractmethod
+    def configure(self, **params):
+        """Change parameters (e.g. distance_fun, R0, R1) between frames."""
+        pass
+
+    @abstractmethod
+    def reseed(self, seed: int):
+        """Restart random number generation from the seed."""
         pass
 
 
@@ -41,136 +103,878 @@ class CatAlgorithm(AbstractAlgo):
         R1: ti.f32,
         limit_per_cell: int = 50,
         distance_fun: int = DistanceFunction.EUCLIDEAN,
+        max_batch: int = 8,
+        sort_cats: bool = False,
+        incremental: bool = False,
+        rebuild_fraction: float = 0.1,
+        seed: int | None = None,
+        exact: bool = False,
+        cell_size: float | str | None = None,
+        symmetric: bool = False,
+        compute_dtype=ti.f64,
+        grid_cache_path: str | None = GRID_CACHE_PATH,
     ):
+        self.X_border = X_border
+        self.Y_border = Y_border
         self.N = N
-        self.R0 = R0
-        self.R1 = R1
+
+        if compute_dtype not in (ti.f32, ti.f64):
+            raise ValueError(f"Unsupported compute dtype {compute_dtype}.")
+        # type of positions and distances, f32 is faster and still exact
+        # for integer coordinates of usual maps
+        self.compute_dtype = compute_dtype
+
+        if seed is None:
+            seed = np.random.SeedSequence().generate_state(1)[0]
+        self.reseed(seed)
 
         self.limit_per_cell = limit_per_cell
+        # max number of frames processed by one kernel launch
+        self.max_batch = max_batch
+        # copy positions into a buffer ordered by cells before the neighbour search
+        self.sort_cats = sort_cats
+        # keep the grid between frames and move only cats which changed their cell,
+        # the grid is rebuilt when more than `rebuild_fraction` of cats migrate
+        self.incremental = incremental
+        self.max_migrants = int(N * rebuild_fraction)
+        self.max_tombstones = N // 4
+        # no `limit_per_cell` cap: cats of every cell are sorted by x and only
+        # the ones within the search radius along x are checked
+        self.exact = exact
+        # fights are found by a pass over cat pairs, each pair is checked once
+        # and marks both cats, then only hissing is decided per cat
+        self.symmetric = symmetric
 
-        self.cell_size = self.R1
-        self.cell_Xn = int(X_border / self.cell_size) + 1
-        self.cell_Yn = int(Y_border / self.cell_size) + 1
+        # any cell size works: cats are looked for in all cells within the radius,
+        # "auto" picks the fastest one with tune_cell_size() in start(),
+        # the choice is cached in `grid_cache_path`
+        if cell_size is None:
+            cell_size = R1
+        if cell_size != "auto" and not cell_size > 0:
+            raise ValueError(f"Invalid cell size {cell_size}.")
+        self.cell_size = cell_size
+        self.grid_cache_path = grid_cache_path
+        if cell_size != "auto":
+            self.set_grid(cell_size)
 
-        if distance_fun == DistanceFunction.EUCLIDEAN:
-            self.distance_fun = self.euclidean_distance
-        elif distance_fun == DistanceFunction.CHEBYSHEV:
-            self.distance_fun = self.chebyshev_distance
-        elif distance_fun == DistanceFunction.MANHATTAN:
-            self.distance_fun = self.manhattan_distance
-        else:
-            raise Exception("Unknown distance function")
+        self.search_radius = None  # radii fields are created in start()
+        self.configure(distance_fun=distance_fun, R0=R0, R1=R1)
+
+    def configure(self, distance_fun: int | None = None, R0=None, R1=None):
+        """
+        Change the distance function and/or the radii, also between frames of
+        a started algorithm. Kernels aren't compiled again: the distance function
+        is a kernel template argument (every one is compiled once per instance)
+        and the radii are read from fields.
+        """
+        if distance_fun is not None:
+            if distance_fun not in (
+                DistanceFunction.EUCLIDEAN,
+                DistanceFunction.MANHATTAN,
+                DistanceFunction.CHEBYSHEV,
+            ):
+                raise Exception("Unknown distance function")
+            self.distance_fun = distance_fun
+        if R0 is not None:
+            self.R0 = R0
+        if R1 is not None:
+            self.R1 = R1
+
+        if self.search_radius is not None:
+            self.__fill_radii()
+
+    def search_radii(self) -> tuple:
+        """Radii of the neighbour search passes of update_states, -1 skips a pass."""
+        if self.symmetric:
+            # only hissing is left, it is impossible without fights within R1 <= R0
+            return (self.R1 if self.R1 > self.R0 else -1,)
+        if self.exact:
+            return (self.R0, max(self.R0, self.R1))
+        return (max(self.R0, self.R1),)
+
+    def __fill_radii(self):
+        self.fight_radius[None] = self.R0
+        # squared distances are compared, so no sqrt is needed
+        self.fight_radius_squared[None] = self.R0**2
+        self.hiss_radius_squared[None] = self.R1**2
+        for r, radius in enumerate(self.search_radii()):
+            self.search_radius[r] = radius
+
+    def set_grid(self, cell_size: float):
+        """Set the cell size and the sizes of the grid fields. Call before start()."""
+        self.cell_size = cell_size
+        self.cell_Xn = int(self.X_border / self.cell_size) + 1
+        self.cell_Yn = int(self.Y_border / self.cell_size) + 1
+        self.cell_count = self.cell_Xn * self.cell_Yn
+
+        # cells prefix sum works on ~sqrt(cells) blocks of ~sqrt(cells) cells each
+        self.scan_block = max(int(self.cell_count**0.5), 1)
+        self.scan_blocks = (self.cell_count + self.scan_block - 1) // self.scan_block
+
+        # incremental grid reserves free slots in every cell for arriving cats
+        self.cats_capacity = self.N
+        if self.incremental:
+            self.cats_capacity += self.N // 4 + 2 * self.cell_count
+        self.cats_order_size = self.cats_capacity if self.sort_cats else self.N
+
+    def grid_config(self) -> dict:
+        """Return the parameters which the grid speed depends on (see tune_cell_size)."""
+        return {
+            "limit_per_cell": self.limit_per_cell,
+            "max_batch": self.max_batch,
+            "distance_fun": self.distance_fun,
+            "sort_cats": self.sort_cats,
+            "incremental": self.incremental,
+            "exact": self.exact,
+            "symmetric": self.symmetric,
+            "compute_dtype": self.compute_dtype,
+        }
 
     def start(self):
-        self.cats_per_cell = ti.field(dtype=ti.i32, shape=(self.cell_Xn, self.cell_Yn))
-        self.column_sum = ti.field(dtype=ti.i32, shape=self.cell_Xn)
-        self.prefix_sum = ti.field(dtype=ti.i32, shape=(self.cell_Xn, self.cell_Yn))
-        self.list_head = ti.field(dtype=ti.i32, shape=self.cell_Xn * self.cell_Yn)
-        self.list_cur = ti.field(dtype=ti.i32, shape=self.cell_Xn * self.cell_Yn)
-        self.list_tail = ti.field(dtype=ti.i32, shape=self.cell_Xn * self.cell_Yn)
-        self.cats_id = ti.field(dtype=ti.i32, shape=self.N)
+        # the tuner starts algorithms of its own, so it runs before
+        # the fields builder of this one is opened
+        if self.cell_size == "auto":
+            self.set_grid(
+                tune_cell_size(
+                    self.X_border,
+                    self.Y_border,
+                    self.N,
+                    self.R0,
+                    self.R1,
+                    cache_path=self.grid_cache_path,
+                    **self.grid_config(),
+                )
+            )
+
+        # fields live in an own SNode tree, so destroy() can free them
+        self.__fields = ti.FieldsBuilder()
+
+        # radii are read at run time, so configure() doesn't compile kernels again
+        self.fight_radius = self.__field(self.compute_dtype)
+        self.fight_radius_squared = self.__field(self.compute_dtype)
+        self.hiss_radius_squared = self.__field(self.compute_dtype)
+        self.search_radius = self.__field(self.compute_dtype, len(self.search_radii()))
+
+        self.cats_per_cell = self.__field(ti.i32, self.cell_count)
+        self.block_sum = self.__field(ti.i32, self.scan_blocks)
+        self.list_head = self.__field(ti.i32, self.cell_count)
+        self.list_cur = self.__field(ti.i32, self.cell_count)
+        self.list_tail = self.__field(ti.i32, self.cell_count)
+        self.cats_id = self.__field(ti.i32, self.cats_capacity)
+        if self.sort_cats:
+            self.sorted_pos = self.__field(self.compute_dtype, self.cats_capacity, n=2)
+        if self.exact:
+            self.cell_x = self.__field(self.compute_dtype, self.cats_capacity)
+        if self.symmetric:
+            self.fighting = self.__field(ti.i32, self.N)
+        if self.incremental:
+            self.list_cap = self.__field(ti.i32, self.cell_count)
+            self.cat_cell = self.__field(ti.i32, self.N)
+            self.cat_slot = self.__field(ti.i32, self.N)
+
+            self.migrants = self.__field(ti.i32)
+            self.tombstones = self.__field(ti.i32)
+            self.rebuild = self.__field(ti.i32)
+
+        self.__snode_tree = self.__fields.finalize()
+        self.__fill_radii()
+        if self.incremental:
+            self.cat_cell.fill(-1)  # every cat migrates, so the first frame rebuilds
+
+    def destroy(self):
+        """Free the fields of start(), the algorithm can be started again."""
+        self.__snode_tree.destroy()
+        self.search_radius = None
+
+    def __field(self, dtype, shape=(), n=None):
+        field = ti.field(dtype) if n is None else ti.Vector.field(n, dtype)
+        if shape == ():
+            self.__fields.place(field)
+        else:
+            self.__fields.dense(ti.i, shape).place(field)
+        return field
 
     @ti.func
-    def euclidean_distance(self, x0, y0, x1, y1) -> ti.float64:
-        return ti.sqrt((x0 - x1) ** 2 + (y0 - y1) ** 2)
+    def squared_euclidean_distance(self, x0, y0, x1, y1):
+        return (x0 - x1) ** 2 + (y0 - y1) ** 2
 
     @ti.func
-    def manhattan_distance(self, x0, y0, x1, y1) -> ti.float64:
+    def manhattan_distance(self, x0, y0, x1, y1):
         return ti.abs(x0 - x1) + ti.abs(y0 - y1)
 
     @ti.func
-    def chebyshev_distance(self, x0, y0, x1, y1) -> ti.float64:
+    def chebyshev_distance(self, x0, y0, x1, y1):
         return ti.max(ti.abs(x0 - x1), ti.abs(y0 - y1))
 
+    @ti.func
+    def squared_distance(self, distance_fun: ti.template(), x0, y0, x1, y1):
+        """Square of the distance: it is compared with R0**2 and R1**2 and gives
+        the hissing probability 1 / dist**2 directly."""
+        dist_squared = ti.cast(0.0, self.compute_dtype)
+        if ti.static(distance_fun == DistanceFunction.EUCLIDEAN):
+            dist_squared = self.squared_euclidean_distance(x0, y0, x1, y1)
+        elif ti.static(distance_fun == DistanceFunction.MANHATTAN):
+            dist = self.manhattan_distance(x0, y0, x1, y1)
+            dist_squared = dist * dist
+        else:
+            dist = self.chebyshev_distance(x0, y0, x1, y1)
+            dist_squared = dist * dist
+        return dist_squared
+
+    def reseed(self, seed: int):
+        self.seed = int(seed) % 2**32
+        self.frame = 0
+
+    def get_states(self, cat_pos, out_states, frame=None):
+        """Process cats of one frame: cat_pos (2, N), out_states (N)."""
+        self.get_states_batch(cat_pos[np.newaxis], out_states[np.newaxis], frame)
+
+    def get_states_batch(self, cat_pos, out_states, first_frame=None):
+        """Process a stack of frames: cat_pos (K, 2, N), out_states (K, N).
+
+        Frames go by `max_batch` in a single kernel launch, the rest one by
+        one, so only these two batch sizes are compiled (see batch_sizes()).
+        Frames are numbered from `first_frame`, by default the numbering continues
+        from the previous call.
+        """
+        if first_frame is None:
+            first_frame = self.frame
+
+        frames = cat_pos.shape[0]
+        begin = 0
+        while begin < frames:
+            # every distinct size is a kernel of its own
+            size = self.max_batch if frames - begin >= self.max_batch else 1
+            self.__process_frames(
+                cat_pos[begin : begin + size],
+                out_states[begin : begin + size],
+                size,
+                first_frame + begin,
+                self.seed,
+                self.distance_fun,
+            )
+            begin += size
+
+        self.frame = first_frame + frames
+
+    def batch_sizes(self) -> tuple:
+        """Frames per kernel launch which get_states_batch uses."""
+        return tuple(sorted({1, self.max_batch}))
+
+    def warm_up(
+        self,
+        coords_dtype=int,
+        states_dtype=int,
+        distance_funs=(
+            DistanceFunction.EUCLIDEAN,
+            DistanceFunction.MANHATTAN,
+            DistanceFunction.CHEBYSHEV,
+        ),
+        batch_sizes=None,
+    ):
+        """Compile the kernel for every distance function and batch size
+        (frames per launch, all the ones of get_states_batch by default)
+        before the first frame. Call after start().
+
+        Kernels are compiled for the dtypes of cat_pos and out_states. With the
+        offline cache (see init_taichi) next runs load them instead of compiling.
+        """
+        # cats are spread over the map in a lattice: in a single cell the
+        # neighbour search of exact mode would be quadratic
+        cols = max(int(np.ceil(np.sqrt(self.N * self.X_border / self.Y_border))), 1)
+        rows = -(-self.N // cols)
+        ids = np.arange(self.N)
+        lattice = np.stack(
+            [ids % cols * (self.X_border / cols), ids // cols * (self.Y_border / rows)]
+        )
+        if batch_sizes is None:
+            batch_sizes = self.batch_sizes()
+        for frames in batch_sizes:
+            cat_pos = np.repeat(lattice[np.newaxis], frames, axis=0).astype(
+                coords_dtype
+            )
+            # no cat is in a processed state, so only the grid is built
+            out_states = np.zeros((frames, self.N), dtype=states_dtype)
+            for distance_fun in distance_funs:
+                self.__process_frames(
+                    cat_pos, out_states, frames, 0, self.seed, distance_fun
+                )
+
+        if self.incremental:
+            self.cat_cell.fill(-1)  # forget the warm up frames, the next frame rebuilds
+
     @ti.kernel
-    def get_states(self, cat_pos: ti.types.ndarray(), out_states: ti.types.ndarray()):
-        self.cats_per_cell.fill(0)
+    def __process_frames(
+        self,
+        cat_pos: ti.types.ndarray(ndim=3),
+        out_states: ti.types.ndarray(ndim=2),
+        frames: ti.template(),
+        first_frame: ti.i32,
+        seed: ti.u32,
+        distance_fun: ti.template(),
+    ):
+        # unrolled, so loops of every frame stay parallel and share the grid fields
+        for k in ti.static(range(frames)):
+            self.build_grid(cat_pos, k)
+            if ti.static(self.symmetric):
+                self.mark_fights(cat_pos, out_states, k, distance_fun)
+            self.update_states(
+                cat_pos, out_states, k, first_frame + k, seed, distance_fun
+            )
+
+    @ti.func
+    def random(self, seed, frame, i, j):
+        """Uniform [0, 1) number defined only by the seed, frame and pair of cats.
+
+        Unlike ti.random it doesn't depend on threads scheduling.
+        """
+        h = pcg_hash(ti.u32(i))
+        h = pcg_hash(h ^ ti.u32(j))
+        h = pcg_hash(h ^ ti.u32(frame))
+        h = pcg_hash(h ^ seed)
+        return hash_uniform(h)
+
+    @ti.func
+    def cell_of(self, cat_pos: ti.template(), k, i):
+        x_idx = ti.floor(cat_pos[k, 0, i] / self.cell_size, int)
+        y_idx = ti.floor(cat_pos[k, 1, i] / self.cell_size, int)
+        return x_idx * self.cell_Yn + y_idx
+
+    @ti.func
+    def rebuilding(self):
+        """Whether the grid is built from scratch in the current frame."""
+        res = 1
+        if ti.static(self.incremental):
+            res = self.rebuild[None]
+        return res
+
+    @ti.func
+    def cell_capacity(self, c):
+        capacity = self.cats_per_cell[c]
+        if ti.static(self.incremental):
+            capacity += self.cats_per_cell[c] // 4 + 2
+        return capacity
+
+    @ti.func
+    def build_grid(self, cat_pos: ti.template(), k):
+        if ti.static(self.incremental):
+            self.relocate_cats(cat_pos, k)
+
+        # counting sort of cats by cells
+        for c in range(self.cell_count):
+            if self.rebuilding():
+                self.cats_per_cell[c] = 0
         for i in range(self.N):
-            x_idx = ti.floor(cat_pos[0, i] / self.cell_size, int)
-            y_idx = ti.floor(cat_pos[1, i] / self.cell_size, int)
-            ti.atomic_add(self.cats_per_cell[x_idx, y_idx], 1)
-
-        for i in range(self.cell_Xn):
-            cur_sum = 0
-            for j in range(self.cell_Yn):
-                cur_sum += self.cats_per_cell[i, j]
-            self.column_sum[i] = cur_sum
-
-        self.prefix_sum[0, 0] = 0
-        ti.loop_config(serialize=True)
-        for i in range(1, self.cell_Xn):
-            self.prefix_sum[i, 0] = self.prefix_sum[i - 1, 0] + self.column_sum[i - 1]
-
-        for i in range(self.cell_Xn):
-            for j in range(self.cell_Yn):
-                if j == 0:
-                    self.prefix_sum[i, j] += self.cats_per_cell[i, j]
-                else:
-                    self.prefix_sum[i, j] = (
-                        self.prefix_sum[i, j - 1] + self.cats_per_cell[i, j]
-                    )
+            if self.rebuilding():
+                ti.atomic_add(self.cats_per_cell[self.cell_of(cat_pos, k, i)], 1)
 
-                linear_idx = i * self.cell_Yn + j
-                self.list_head[linear_idx] = (
-                    self.prefix_sum[i, j] - self.cats_per_cell[i, j]
-                )
-                self.list_cur[linear_idx] = self.list_head[linear_idx]
-                self.list_tail[linear_idx] = self.prefix_sum[i, j]
+        self.scan_cells()
 
+        if ti.static(self.incremental):
+            # free slots must not hold ids of cats
+            for p in range(self.cats_capacity):
+                if self.rebuilding():
+                    self.cats_id[p] = -1
         for i in range(self.N):
-            x_idx = ti.floor(cat_pos[0, i] / self.cell_size, int)
-            y_idx = ti.floor(cat_pos[1, i] / self.cell_size, int)
-            linear_idx = x_idx * self.cell_Yn + y_idx
-            cell_location = ti.atomic_add(self.list_cur[linear_idx], 1)
-            self.cats_id[cell_location] = i
+            if self.rebuilding():
+                linear_idx = self.cell_of(cat_pos, k, i)
+                cell_location = ti.atomic_add(self.list_cur[linear_idx], 1)
+                self.cats_id[cell_location] = i
+                if ti.static(self.incremental):
+                    self.cat_cell[i] = linear_idx
+                    self.cat_slot[i] = cell_location
+
+        if ti.static(self.exact):
+            self.sort_cells_by_x(cat_pos, k)
+
+        if ti.static(self.sort_cats):
+            for p in range(self.cats_capacity):
+                i = self.cats_id[p]
+                if i >= 0:
+                    pos = ti.Vector([cat_pos[k, 0, i], cat_pos[k, 1, i]])
+                    self.sorted_pos[p] = ti.cast(pos, self.compute_dtype)
+
+    @ti.func
+    def sort_cells_by_x(self, cat_pos: ti.template(), k):
+        """Order cats of every cell by x, free slots go last."""
+        for p in range(self.cats_capacity):
+            x = ti.cast(ti.math.inf, self.compute_dtype)
+            i = self.cats_id[p]
+            if i >= 0:
+                x = ti.cast(cat_pos[k, 0, i], self.compute_dtype)
+            self.cell_x[p] = x
+
+        # insertion sort: cells are small, cells of the incremental grid are
+        # almost sorted since the previous frame
+        for c in range(self.cell_count):
+            head = self.list_head[c]
+            for p in range(head + 1, self.list_tail[c]):
+                x = self.cell_x[p]
+                i = self.cats_id[p]
+                q = p
+                while q > head:
+                    if self.cell_x[q - 1] <= x:
+                        break
+                    self.cell_x[q] = self.cell_x[q - 1]
+                    self.cats_id[q] = self.cats_id[q - 1]
+                    q -= 1
+                self.cell_x[q] = x
+                self.cats_id[q] = i
+
+            if ti.static(self.incremental):
+                for p in range(head, self.list_tail[c]):
+                    i = self.cats_id[p]
+                    if i >= 0:
+                        self.cat_slot[i] = p
+
+    @ti.func
+    def lower_bound(self, begin, end, x):
+        """First place in [begin, end) of an x-sorted cell with cell_x >= x."""
+        lo = begin
+        hi = end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.cell_x[mid] < x:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
 
+    @ti.func
+    def relocate_cats(self, cat_pos: ti.template(), k):
+        """Move cats which changed their cell, or request a full rebuild."""
+        for _ in range(1):
+            self.migrants[None] = 0
         for i in range(self.N):
+            if self.cell_of(cat_pos, k, i) != self.cat_cell[i]:
+                ti.atomic_add(self.migrants[None], 1)
+
+        for _ in range(1):
+            self.rebuild[None] = 0
+            self.tombstones[None] += self.migrants[None]
             if (
-                out_states[i] != BasicState.WALK
-                and out_states[i] != BasicState.HISS
-                and out_states[i] != BasicState.FIGHT
+                self.migrants[None] > self.max_migrants
+                or self.tombstones[None] > self.max_tombstones
             ):
+                self.rebuild[None] = 1
+                self.tombstones[None] = 0
+
+        # leave a tombstone in the old cell and take a free slot in the new one
+        for i in range(self.N):
+            linear_idx = self.cell_of(cat_pos, k, i)
+            if not self.rebuilding() and linear_idx != self.cat_cell[i]:
+                self.cats_id[self.cat_slot[i]] = -1
+                cell_location = ti.atomic_add(self.list_tail[linear_idx], 1)
+                if cell_location < self.list_cap[linear_idx]:
+                    self.cats_id[cell_location] = i
+                    self.cat_cell[i] = linear_idx
+                    self.cat_slot[i] = cell_location
+                else:
+                    # no free slots left in the cell
+                    self.rebuild[None] = 1
+                    self.tombstones[None] = 0
+
+    @ti.func
+    def scan_cells(self):
+        """Fill cells list bounds with a blocked parallel prefix sum of cell capacities."""
+        # inclusive scan inside every block, blocks are processed in parallel
+        for b in range(self.scan_blocks):
+            if self.rebuilding():
+                cur_sum = 0
+                for c in range(
+                    b * self.scan_block,
+                    min((b + 1) * self.scan_block, self.cell_count),
+                ):
+                    cur_sum += self.cell_capacity(c)
+                    self.list_tail[c] = cur_sum
+                self.block_sum[b] = cur_sum
+
+        # exclusive scan of block sums in a single task (only ~sqrt(cells) of them)
+        for _ in range(1):
+            if self.rebuilding():
+                cur_sum = 0
+                for b in range(self.scan_blocks):
+                    block_sum = self.block_sum[b]
+                    self.block_sum[b] = cur_sum
+                    cur_sum += block_sum
+
+        # add offsets of previous blocks
+        for c in range(self.cell_count):
+            if self.rebuilding():
+                cell_end = self.list_tail[c] + self.block_sum[c // self.scan_block]
+                self.list_head[c] = cell_end - self.cell_capacity(c)
+                self.list_cur[c] = self.list_head[c]
+                self.list_tail[c] = self.list_head[c] + self.cats_per_cell[c]
+                if ti.static(self.incremental):
+                    self.list_cap[c] = cell_end
+
+    @ti.func
+    def cat_position(self, cat_pos: ti.template(), k, p):
+        """Position of the cat stored in the p-th place of cats_id."""
+        pos = ti.Vector([0.0, 0.0], dt=self.compute_dtype)
+        if ti.static(self.sort_cats):
+            pos = self.sorted_pos[p]
+        else:
+            j = self.cats_id[p]
+            pos = ti.Vector([cat_pos[k, 0, j], cat_pos[k, 1, j]], dt=self.compute_dtype)
+        return pos
+
+    @ti.func
+    def processed(self, state):
+        """Whether the state is decided by the algorithm, other states are kept."""
+        return (
+            state == BasicState.WALK
+            or state == BasicState.HISS
+            or state == BasicState.FIGHT
+        )
+
+    @ti.func
+    def mark_fights(
+        self,
+        cat_pos: ti.template(),
+        out_states: ti.template(),
+        k,
+        distance_fun: ti.template(),
+    ):
+        """Set `fighting` of both cats of every pair closer than R0."""
+        for i in range(self.N):
+            self.fighting[i] = 0
+
+        for c in range(self.cell_count):
+            tail = self.list_tail[c]
+            for p in range(self.list_head[c], tail):
+                i = self.cats_id[p]
+                if ti.static(self.incremental):
+                    if i < 0:
+                        continue  # the cat has left this cell
+
+                # cats with kept states scan too, so every pair is looked at
+                # from the cat with the smaller place only
+                pos_i = self.cat_position(cat_pos, k, p)
+                processed_i = self.processed(out_states[k, i])
+                # pairs with the next cats of the cell
+                self.mark_cell_fights(
+                    cat_pos,
+                    out_states,
+                    k,
+                    distance_fun,
+                    i,
+                    processed_i,
+                    pos_i,
+                    p + 1,
+                    tail,
+                )
+
+                # and with cats of the next cells within R0
+                R0 = self.fight_radius[None]
+                x_begin = max(ti.floor((pos_i[0] - R0) / self.cell_size, int), 0)
+                x_end = min(
+                    ti.floor((pos_i[0] + R0) / self.cell_size, int) + 1, self.cell_Xn
+                )
+                y_begin = max(ti.floor((pos_i[1] - R0) / self.cell_size, int), 0)
+                y_end = min(
+                    ti.floor((pos_i[1] + R0) / self.cell_size, int) + 1, self.cell_Yn
+                )
+                for neigh_x in range(x_begin, x_end):
+                    for neigh_y in range(y_begin, y_end):
+                        neigh = neigh_x * self.cell_Yn + neigh_y
+                        if neigh > c:
+                            self.mark_cell_fights(
+                                cat_pos,
+                                out_states,
+                                k,
+                                distance_fun,
+                                i,
+                                processed_i,
+                                pos_i,
+                                self.list_head[neigh],
+                                self.list_tail[neigh],
+                            )
+
+    @ti.func
+    def mark_cell_fights(
+        self,
+        cat_pos: ti.template(),
+        out_states: ti.template(),
+        k,
+        distance_fun: ti.template(),
+        i,
+        processed_i,
+        pos_i,
+        begin,
+        end,
+    ):
+        """Mark fights of cat i with cats in the places [begin, end) of a cell,
+        only cats whose states are decided by the algorithm are marked."""
+        R0 = self.fight_radius[None]
+        R0_squared = self.fight_radius_squared[None]
+        if ti.static(self.exact):
+            begin = self.lower_bound(begin, end, pos_i[0] - R0)
+
+        processed = 0
+        for p in range(begin, end):
+            if ti.static(self.exact):
+                if self.cell_x[p] > pos_i[0] + R0:
+                    break
+            j = self.cats_id[p]
+            if ti.static(self.incremental):
+                if j < 0:
+                    continue
+            if ti.static(not self.exact):
+                if processed > self.limit_per_cell:
+                    break
+                processed += 1
+            processed_j = self.processed(out_states[k, j])
+            # nothing to learn from a pair whose cats already fight or keep states
+            unknown_i = processed_i and self.fighting[i] == 0
+            unknown_j = processed_j and self.fighting[j] == 0
+            if unknown_i or unknown_j:
+                pos_j = self.cat_position(cat_pos, k, p)
+                dist_squared = self.squared_distance(
+                    distance_fun, pos_i[0], pos_i[1], pos_j[0], pos_j[1]
+                )
+                if dist_squared <= R0_squared:
+                    if processed_i:
+                        ti.atomic_or(self.fighting[i], 1)
+                    if processed_j:
+                        ti.atomic_or(self.fighting[j], 1)
+
+    @ti.func
+    def scan_cell(
+        self,
+        cat_pos: ti.template(),
+        k,
+        frame,
+        seed,
+        distance_fun: ti.template(),
+        i,
+        pos_i,
+        cell,
+        radius,
+        state,
+    ):
+        """Update the state of cat i with cats of the cell."""
+        begin = self.list_head[cell]
+        end = self.list_tail[cell]
+        R0_squared = self.fight_radius_squared[None]
+        R1_squared = self.hiss_radius_squared[None]
+        if ti.static(self.exact):
+            begin = self.lower_bound(begin, end, pos_i[0] - radius)
+
+        processed = 0
+        for p in range(begin, end):
+            if ti.static(self.exact):
+                # every distance function is at least |dx|
+                if self.cell_x[p] > pos_i[0] + radius:
+                    break
+            j = self.cats_id[p]
+            if ti.static(self.incremental):
+                if j < 0:
+                    continue  # the cat has left this cell
+            if ti.static(not self.exact):
+                if processed > self.limit_per_cell:
+                    break
+                processed += 1
+            if i != j:
+                pos_j = self.cat_position(cat_pos, k, p)
+                dist_squared = self.squared_distance(
+                    distance_fun, pos_i[0], pos_i[1], pos_j[0], pos_j[1]
+                )
+                if dist_squared <= R0_squared:
+                    state = BasicState.FIGHT
+                    break
+                # hissing cat keeps looking for a fight, so the result
+                # doesn't depend on the order of cats in the cell
+                elif state == BasicState.WALK and dist_squared <= R1_squared:
+                    prob = 1.0 / dist_squared
+                    rand = self.random(seed, frame, i, j)
+                    if prob <= rand:
+                        state = BasicState.HISS
+                        if ti.static(self.symmetric):
+                            break  # fights are already known
+        return state
+
+    @ti.func
+    def update_states(
+        self,
+        cat_pos: ti.template(),
+        out_states: ti.template(),
+        k,
+        frame,
+        seed,
+        distance_fun: ti.template(),
+    ):
+        # with sorted cats walk over grid slots in the cells order, so neighbours
+        # are read from adjacent memory, and scatter states back to the original ids
+        for idx in range(self.cats_order_size):
+            i = idx
+            if ti.static(self.sort_cats):
+                i = self.cats_id[idx]
+                if i < 0:
+                    continue  # a free slot of the incremental grid
+
+            if not self.processed(out_states[k, i]):
                 continue
 
-            x_idx = ti.floor(cat_pos[0, i] / self.cell_size, int)
-            y_idx = ti.floor(cat_pos[1, i] / self.cell_size, int)
-            x_begin = max(x_idx - 1, 0)
-            x_end = min(x_idx + 2, self.cell_Xn)
-            y_begin = max(y_idx - 1, 0)
-            y_end = min(y_idx + 2, self.cell_Yn)
+            pos_i = ti.Vector(
+                [cat_pos[k, 0, i], cat_pos[k, 1, i]], dt=self.compute_dtype
+            )
+            if ti.static(self.sort_cats):
+                pos_i = self.cat_position(cat_pos, k, idx)
 
             state = BasicState.WALK
-            for neigh_x in range(x_begin, x_end):
-                for neigh_y in range(y_begin, y_end):
-                    neigh_linear_idx = neigh_x * self.cell_Yn + neigh_y
-                    processed = 0
-                    for p in range(
-                        self.list_head[neigh_linear_idx],
-                        self.list_tail[neigh_linear_idx],
-                    ):
-                        if processed > self.limit_per_cell:
-                            break
-                        processed += 1
-                        j = self.cats_id[p]
-                        if i != j:
-                            dist = self.distance_fun(
-                                cat_pos[0, i],
-                                cat_pos[1, i],
-                                cat_pos[0, j],
-                                cat_pos[1, j],
+            if ti.static(self.symmetric):
+                if self.fighting[i]:
+                    state = BasicState.FIGHT
+            # exact mode looks for a fight among the closest cats first,
+            # in dense areas it is found at once and the wide band is skipped
+            for r in ti.static(range(len(self.search_radii()))):
+                radius = self.search_radius[r]
+                # only cells intersecting the square around the cat
+                x_begin = max(ti.floor((pos_i[0] - radius) / self.cell_size, int), 0)
+                x_end = min(
+                    ti.floor((pos_i[0] + radius) / self.cell_size, int) + 1,
+                    self.cell_Xn,
+                )
+                if radius < 0:
+                    x_end = x_begin  # the pass is skipped
+                y_begin = max(ti.floor((pos_i[1] - radius) / self.cell_size, int), 0)
+                y_end = min(
+                    ti.floor((pos_i[1] + radius) / self.cell_size, int) + 1,
+                    self.cell_Yn,
+                )
+                for neigh_x in range(x_begin, x_end):
+                    for neigh_y in range(y_begin, y_end):
+                        searching = state != BasicState.FIGHT
+                        if ti.static(self.symmetric or (self.exact and r > 0)):
+                            # fights are known: found by the pair pass or by
+                            # the exact first pass over everybody within R0
+                            searching = state == BasicState.WALK
+                        if searching:
+                            state = self.scan_cell(
+                                cat_pos,
+                                k,
+                                frame,
+                                seed,
+                                distance_fun,
+                                i,
+                                pos_i,
+                                neigh_x * self.cell_Yn + neigh_y,
+                                radius,
+                                state,
                             )
-                            if dist <= self.R0:
-                                state = BasicState.FIGHT
-                                break
-                            elif dist <= self.R1:
-                                prob = 1.0 / (dist**2)
-                                rand = ti.random(ti.f64)
-                                if prob <= rand:
-                                    state = BasicState.HISS
-                                    break
-                    if state == BasicState.FIGHT:
-                        break
-                if state == BasicState.FIGHT:
-                    break
 
-            out_states[i] = state
+            # states fit any integer dtype of the output (e.g. uint8)
+            out_states[k, i] = ti.cast(state, out_states.get_type().element_type)
+
+
+def time_cell_sizes(
+    X_border,
+    Y_border,
+    N,
+    R0,
+    R1,
+    sample=None,
+    cell_sizes=None,
+    frames: int = 3,
+    **algo_kwargs,
+) -> dict:
+    """
+    Return {cell_size: seconds} of CatAlgorithm.get_states on the sample frame
+    (2, N), uniformly spread cats by default. Every grid is timed after one
+    compiling call, the best of `frames` calls is taken.
+    """
+    if sample is None:
+        rng = np.random.default_rng(0)
+        sample = rng.uniform(0, [[X_border], [Y_border]], size=(2, N)).astype(int)
+
+    if cell_sizes is None:
+        radius = max(R0, R1)
+        cell_sizes = [radius * factor for factor in CELL_SIZE_FACTORS]
+
+    times = {}
+    states = np.empty(N, dtype=int)
+    for cell_size in cell_sizes:
+        algorithm = CatAlgorithm(
+            X_border, Y_border, N, R0, R1, seed=0, cell_size=cell_size, **algo_kwargs
+        )
+        algorithm.start()
+
+        states.fill(BasicState.WALK)
+        algorithm.get_states(sample, states)  # compiles the kernel
+
+        best = float("inf")
+        for _ in range(frames):
+            states.fill(BasicState.WALK)
+            start = perf_counter()
+            algorithm.get_states(sample, states)
+            best = min(best, perf_counter() - start)
+        times[cell_size] = best
+        algorithm.destroy()
+
+    return times
+
+
+# cell sizes tuned by this process
+_tuned_cell_sizes = {}
+
+
+def tune_cell_size(
+    X_border,
+    Y_border,
+    N,
+    R0,
+    R1,
+    sample=None,
+    cache_path: str | None = GRID_CACHE_PATH,
+    arch=None,
+    **algo_kwargs,
+) -> float:
+    """
+    Pick the fastest cell size of CatAlgorithm with time_cell_sizes().
+
+    The choice is cached per configuration (Taichi arch, map, N, radii and
+    `algo_kwargs`, a hash of the sample frame if given) in memory and in the
+    JSON file `cache_path` (None disables the file), so only the first run of
+    a configuration pays for timing the candidate grids. The arch is the one
+    of init_taichi() unless given.
+    """
+    if arch is None:
+        arch = _taichi_arch
+    config = {
+        "arch": arch,
+        "borders": [X_border, Y_border],
+        "N": N,
+        "R0": R0,
+        "R1": R1,
+        **algo_kwargs,
+    }
+    if sample is not None:
+        config["sample"] = hashlib.sha1(np.ascontiguousarray(sample)).hexdigest()
+    key = json.dumps(config, sort_keys=True, default=str)  # str() of Taichi dtypes
+
+    if key in _tuned_cell_sizes:
+        return _tuned_cell_sizes[key]
+
+    cache = {}
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            cache = {}  # a broken cache is rebuilt
+
+    if key not in cache:
+        times = time_cell_sizes(X_border, Y_border, N, R0, R1, sample, **algo_kwargs)
+        cache[key] = min(times, key=times.get)
+
+        if cache_path is not None:
+            # other processes may tune at the same time, the file is replaced whole
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(cache, file, indent=2)
+            os.replace(tmp_path, cache_path)
+
+    _tuned_cell_sizes[key] = cache[key]
+    return cache[key]
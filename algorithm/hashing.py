@@ -0,0 +1,21 @@
+"""Counter-Based Random Numbers for Cats App Kernels"""
+
+import taichi as ti
+
+
+@ti.func
+def pcg_hash(value):
+    """PCG hash of an u32 value."""
+    state = value * ti.u32(747796405) + ti.u32(2891336453)
+    word = ((state >> ((state >> 28) + 4)) ^ state) * ti.u32(277803737)
+    return (word >> 22) ^ word
+
+
+@ti.func
+def hash_uniform(h):
+    """Uniform [0, 1) number of an u32 hash.
+
+    Only the top 24 bits are taken, they are exact in f32, so the largest
+    hashes don't round up to 1.0.
+    """
+    return ti.cast(h >> 8, ti.f32) / 16777216.0
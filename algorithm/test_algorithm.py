@@ -1,6 +1,8 @@
 import time
 import numpy as np
-from algorithm import CatAlgorithm
+from algorithm import algorithm
+from algorithm.algorithm import CatAlgorithm, tune_cell_size
+from algorithm.hashing import hash_uniform
 import taichi as ti
 import pytest
 
@@ -39,3 +41,551 @@ def test_performance(algo: CatAlgorithm):
 
     average_time = time_sum / times
     assert average_time <= 0.5, "Too slow :("
+
+
+def test_batch_performance(algo: CatAlgorithm):
+    ti.init(arch=ti.gpu)
+
+    frames = 8
+    points = np.random.randint(0, 1000, size=(frames, 2, algo.N))
+    algo.start()
+
+    # compile the kernel for this batch size
+    algo.get_states_batch(points, np.ones((frames, algo.N), dtype=int))
+
+    start = time.perf_counter()
+    states = np.random.randint(1, 5, size=(frames, algo.N))
+    algo.get_states_batch(points, states)
+    finish = time.perf_counter()
+
+    average_time = (finish - start) / frames
+    assert average_time <= 0.5, "Too slow :("
+
+
+def test_batch_matches_single_frames():
+    ti.init(arch=ti.gpu)
+
+    # R0 == R1, so there is no random hissing and states are deterministic,
+    # 5 frames go as two batches and a single frame
+    algo = CatAlgorithm(1000, 1000, 500, 25, 25, max_batch=2)
+    algo.start()
+
+    points = np.random.randint(0, 1000, size=(5, 2, algo.N))
+    batch_states = np.random.randint(1, 5, size=(5, algo.N))
+    single_states = batch_states.copy()
+
+    algo.get_states_batch(points, batch_states)
+    for frame_points, frame_states in zip(points, single_states):
+        algo.get_states(frame_points, frame_states)
+
+    assert np.array_equal(batch_states, single_states)
+
+
+@pytest.mark.parametrize("coords_dtype", [np.uint16, np.float32])
+def test_compact_dtypes_match_int(coords_dtype):
+    ti.init(arch=ti.gpu)
+
+    N = 5000
+    points = np.random.randint(0, 1000, size=(2, N))
+
+    results = []
+    for points_dtype, states_dtype in ((int, int), (coords_dtype, np.uint8)):
+        algo = CatAlgorithm(1000, 1000, N, 5, 15, seed=42)
+        algo.start()
+
+        states = np.ones(N, dtype=states_dtype)
+        algo.get_states(points.astype(points_dtype), states)
+        results.append(states)
+
+    assert (results[0] == 2).any(), "Cats should hiss"
+    assert np.array_equal(results[0], results[1])
+
+
+@pytest.mark.parametrize("cell_size", [2, 5, 25, 100])  # R1 sets the grid resolution
+def test_grid_build_performance(cell_size):
+    ti.init(arch=ti.gpu)
+
+    algo = CatAlgorithm(5000, 5000, 500_000, cell_size, cell_size)
+    points = np.random.randint(0, 5000, size=(2, algo.N))
+    algo.start()
+
+    # eating cats (state 4) are skipped by the neighbour search, so only the grid is built
+    algo.get_states(points, np.full(algo.N, 4))
+
+    time_sum = 0
+    times = 5
+
+    for _ in range(times):
+        states = np.full(algo.N, 4)
+        start = time.perf_counter()
+        algo.get_states(points, states)
+        finish = time.perf_counter()
+
+        time_sum += finish - start
+
+    average_time = time_sum / times
+    print(f"\ncell size {cell_size}: grid build {average_time * 1000:.2f} ms")
+    assert average_time <= 0.5, "Too slow :("
+
+
+@pytest.mark.parametrize("compute_dtype", [ti.f64, ti.f32])
+@pytest.mark.parametrize("sort_cats", [False, True])
+@pytest.mark.parametrize("distance_fun", [0, 1, 2])
+def test_states_match_brute_force(distance_fun, sort_cats, compute_dtype):
+    ti.init(arch=ti.gpu)
+
+    N, R = 500, 25
+    # R0 == R1, so there is no random hissing and states are deterministic
+    algo = CatAlgorithm(
+        1000,
+        1000,
+        N,
+        R,
+        R,
+        distance_fun=distance_fun,
+        sort_cats=sort_cats,
+        compute_dtype=compute_dtype,
+    )
+    algo.start()
+
+    points = np.random.randint(0, 1000, size=(2, N))
+    states = np.ones(N, dtype=int)
+    algo.get_states(points, states)
+
+    dx = np.abs(points[0][:, None] - points[0][None, :])
+    dy = np.abs(points[1][:, None] - points[1][None, :])
+    dist = [np.sqrt(dx**2 + dy**2), dx + dy, np.maximum(dx, dy)][distance_fun]
+    dist = dist.astype(float)
+    np.fill_diagonal(dist, np.inf)
+    expected = np.where((dist <= R).any(axis=1), 3, 1)
+
+    assert np.array_equal(states, expected)
+
+
+@pytest.mark.parametrize("sort_cats", [False, True])
+def test_compute_dtype_precision(sort_cats):
+    ti.init(arch=ti.gpu)
+
+    N, R = 200, 5
+    algo = CatAlgorithm(1000, 1000, N, R, R, sort_cats=sort_cats, compute_dtype=ti.f64)
+    algo.start()
+
+    # pairs of cats just farther than R, in f32 the gap rounds to exactly R
+    points = np.zeros((2, N))
+    points[0, 0::2] = 900.0
+    points[0, 1::2] = 900.0 + R + 1e-5
+    points[1] = np.repeat(np.arange(N // 2) * 2 * R, 2)
+
+    states = np.ones(N, dtype=int)
+    algo.get_states(points, states)
+
+    assert (states == 1).all()
+
+
+def test_sorted_cats_performance():
+    ti.init(arch=ti.gpu)
+
+    N = 500_000
+    points = np.random.randint(0, 1500, size=(2, N))
+    points[1] %= 1000
+
+    average_times = {}
+    for sort_cats in (False, True):
+        algo = CatAlgorithm(1500, 1000, N, 5, 15, sort_cats=sort_cats)
+        algo.start()
+        algo.get_states(points, np.ones(N, dtype=int))
+
+        time_sum = 0
+        times = 5
+
+        for _ in range(times):
+            states = np.ones(N, dtype=int)
+            start = time.perf_counter()
+            algo.get_states(points, states)
+            finish = time.perf_counter()
+
+            time_sum += finish - start
+
+        average_times[sort_cats] = time_sum / times
+
+    print(
+        f"\nunsorted: {average_times[False]:.3f}s, sorted: {average_times[True]:.3f}s"
+    )
+    assert average_times[True] <= 0.5, "Too slow :("
+
+
+@pytest.mark.parametrize("sort_cats", [False, True])
+def test_incremental_grid_matches_brute_force(sort_cats):
+    ti.init(arch=ti.gpu)
+
+    N, R = 500, 25
+    algo = CatAlgorithm(1000, 1000, N, R, R, incremental=True, sort_cats=sort_cats)
+    algo.start()
+
+    points = np.random.uniform(0, 1000, size=(2, N))
+    for step in range(20):
+        # few cats move most of the time, sometimes everybody does
+        moving = np.random.random(N) < (0.5 if step % 5 == 4 else 0.02)
+        points[:, moving] = np.random.uniform(0, 1000, size=(2, moving.sum()))
+
+        states = np.ones(N, dtype=int)
+        algo.get_states(points, states)
+
+        dist = np.hypot(
+            points[0][:, None] - points[0][None, :],
+            points[1][:, None] - points[1][None, :],
+        )
+        np.fill_diagonal(dist, np.inf)
+        expected = np.where((dist <= R).any(axis=1), 3, 1)
+
+        assert np.array_equal(states, expected)
+
+
+@pytest.mark.parametrize(
+    "incremental, sort_cats", [(False, False), (False, True), (True, False)]
+)
+@pytest.mark.parametrize("distance_fun", [0, 1, 2])
+def test_exact_mode_matches_brute_force_on_clusters(
+    distance_fun, incremental, sort_cats
+):
+    ti.init(arch=ti.gpu)
+
+    N, R = 2000, 4
+    # a single cat per neighbour cell is checked in the capped mode
+    algo = CatAlgorithm(
+        1000,
+        1000,
+        N,
+        R,
+        R,
+        distance_fun=distance_fun,
+        limit_per_cell=1,
+        incremental=incremental,
+        sort_cats=sort_cats,
+        exact=True,
+    )
+    algo.start()
+
+    centers = np.random.uniform(100, 900, size=(2, 1, 4))
+    points = centers[:, 0, np.random.randint(0, 4, N)]
+    for _ in range(3):
+        points = np.clip(points + np.random.normal(0, 15, size=(2, N)), 0, 999)
+        points = points.astype(int)
+
+        states = np.ones(N, dtype=int)
+        algo.get_states(points, states)
+
+        dx = np.abs(points[0][:, None] - points[0][None, :])
+        dy = np.abs(points[1][:, None] - points[1][None, :])
+        dist = [np.sqrt(dx**2 + dy**2), dx + dy, np.maximum(dx, dy)][distance_fun]
+        dist = dist.astype(float)
+        np.fill_diagonal(dist, np.inf)
+        expected = np.where((dist <= R).any(axis=1), 3, 1)
+
+        assert np.array_equal(states, expected)
+
+
+@pytest.mark.parametrize(
+    "incremental, sort_cats", [(False, False), (False, True), (True, False)]
+)
+@pytest.mark.parametrize("distance_fun", [0, 1, 2])
+def test_symmetric_pass_matches_per_cat_states(distance_fun, incremental, sort_cats):
+    ti.init(arch=ti.gpu)
+
+    N, R0, R1 = 2000, 4, 8
+    params = dict(distance_fun=distance_fun, seed=0, exact=True)
+    per_cat = CatAlgorithm(1000, 1000, N, R0, R1, **params)
+    symmetric = CatAlgorithm(
+        1000,
+        1000,
+        N,
+        R0,
+        R1,
+        incremental=incremental,
+        sort_cats=sort_cats,
+        symmetric=True,
+        **params,
+    )
+    per_cat.start()
+    symmetric.start()
+
+    points = np.random.normal(500, 40, size=(2, N))
+    for _ in range(3):
+        points = np.clip(points + np.random.normal(0, 2, size=(2, N)), 0, 999)
+        frame = points.astype(int)
+
+        # some cats keep their states (e.g. eat) and are only neighbours
+        initial = np.where(np.random.random(N) < 0.2, 4, 1)
+        expected = initial.copy()
+        per_cat.get_states(frame, expected)
+        states = initial.copy()
+        symmetric.get_states(frame, states)
+
+        # the same random hissing as well
+        assert np.array_equal(states, expected)
+
+
+@pytest.mark.parametrize("distance_fun", [0, 1, 2])
+def test_symmetric_pass_in_capped_mode(distance_fun):
+    ti.init(arch=ti.gpu)
+
+    N, R0, R1 = 2000, 4, 8
+    points = np.random.normal(500, 20, size=(2, N))
+    points = np.clip(points, 0, 999).astype(int)
+
+    dx = np.abs(points[0][:, None] - points[0][None, :])
+    dy = np.abs(points[1][:, None] - points[1][None, :])
+    dist = [np.sqrt(dx**2 + dy**2), dx + dy, np.maximum(dx, dy)][distance_fun]
+    dist = dist.astype(float)
+    np.fill_diagonal(dist, np.inf)
+
+    results = {}
+    for limit_per_cell in (N, 2):
+        for symmetric in (False, True):
+            algo = CatAlgorithm(
+                1000,
+                1000,
+                N,
+                R0,
+                R1,
+                distance_fun=distance_fun,
+                limit_per_cell=limit_per_cell,
+                seed=0,
+                symmetric=symmetric,
+            )
+            algo.start()
+            states = np.ones(N, dtype=int)
+            algo.get_states(points, states)
+            results[limit_per_cell, symmetric] = states
+
+    # while no cell is over the cap both passes see the same cats
+    assert np.array_equal(results[N, False], results[N, True])
+
+    # otherwise the pair pass checks other cats of crowded cells, but every
+    # fight and hiss still has a cat close enough
+    states = results[2, True]
+    assert not np.array_equal(states, results[2, False])
+    assert (dist[states == 3] <= R0).any(axis=1).all()
+    assert (dist[states == 2] <= R1).any(axis=1).all()
+
+
+@pytest.mark.parametrize("R0, R1", [(25, 25), (20, 5)])
+@pytest.mark.parametrize("cell_size", [5, 25, 60])
+def test_cell_sizes_match_brute_force(cell_size, R0, R1):
+    ti.init(arch=ti.gpu)
+
+    N = 500
+    # R1 <= R0, so there is no random hissing and states are deterministic
+    algo = CatAlgorithm(1000, 1000, N, R0, R1, cell_size=cell_size)
+    algo.start()
+
+    points = np.random.randint(0, 1000, size=(2, N))
+    states = np.ones(N, dtype=int)
+    algo.get_states(points, states)
+
+    dist = np.hypot(
+        points[0][:, None] - points[0][None, :],
+        points[1][:, None] - points[1][None, :],
+    )
+    np.fill_diagonal(dist, np.inf)
+    expected = np.where((dist <= R0).any(axis=1), 3, 1)
+
+    assert np.array_equal(states, expected)
+
+
+def test_tuned_cell_size_is_cached(tmp_path, monkeypatch):
+    ti.init(arch=ti.gpu)
+
+    cache_path = str(tmp_path / "grid.json")
+    cell_size = tune_cell_size(1000, 1000, 5000, 5, 15, cache_path=cache_path)
+    assert cell_size in [15 * factor for factor in algorithm.CELL_SIZE_FACTORS]
+
+    # the next process reads the choice from the file instead of timing grids
+    def time_cell_sizes(*args, **kwargs):
+        raise AssertionError("Grids are timed again.")
+
+    monkeypatch.setattr(algorithm, "_tuned_cell_sizes", {})
+    monkeypatch.setattr(algorithm, "time_cell_sizes", time_cell_sizes)
+    assert tune_cell_size(1000, 1000, 5000, 5, 15, cache_path=cache_path) == cell_size
+
+
+def test_auto_cell_size_on_cold_cache(tmp_path, monkeypatch):
+    ti.init(arch=ti.gpu)
+
+    N, R = 1000, 25
+    monkeypatch.setattr(algorithm, "_tuned_cell_sizes", {})
+    cache_path = str(tmp_path / "grid.json")
+    # the candidate grids are timed by start() itself
+    algo = CatAlgorithm(
+        1000, 1000, N, R, R, cell_size="auto", grid_cache_path=cache_path
+    )
+    algo.start()
+    assert algo.cell_size in [R * factor for factor in algorithm.CELL_SIZE_FACTORS]
+    assert algo.cell_Xn == int(1000 / algo.cell_size) + 1
+
+    points = np.random.randint(0, 1000, size=(2, N))
+    states = np.ones(N, dtype=int)
+    algo.get_states(points, states)
+
+    dist = np.hypot(
+        points[0][:, None] - points[0][None, :],
+        points[1][:, None] - points[1][None, :],
+    )
+    np.fill_diagonal(dist, np.inf)
+    expected = np.where((dist <= R).any(axis=1), 3, 1)
+
+    assert np.array_equal(states, expected)
+
+
+def test_incremental_grid_performance():
+    ti.init(arch=ti.gpu)
+
+    N = 500_000
+    points = np.random.uniform(0, 5000, size=(2, N))
+
+    average_times = {}
+    for incremental in (False, True):
+        algo = CatAlgorithm(5000, 5000, N, 5, 5, incremental=incremental)
+        algo.start()
+        algo.get_states(points, np.full(N, 4))
+
+        time_sum = 0
+        times = 5
+
+        for _ in range(times):
+            # 1% of cats move to another place, eating cats skip the neighbour search
+            moving = np.random.random(N) < 0.01
+            points[:, moving] = np.random.uniform(0, 5000, size=(2, moving.sum()))
+            states = np.full(N, 4)
+
+            start = time.perf_counter()
+            algo.get_states(points, states)
+            finish = time.perf_counter()
+
+            time_sum += finish - start
+
+        average_times[incremental] = time_sum / times
+
+    print(
+        f"\nrebuild: {average_times[False]:.3f}s, "
+        f"incremental: {average_times[True]:.3f}s"
+    )
+    assert average_times[True] <= 0.5, "Too slow :("
+
+
+def test_seed_reproducibility():
+    ti.init(arch=ti.gpu)
+
+    N = 50_000
+    points = np.random.randint(0, 1000, size=(3, 2, N))
+
+    results = []
+    for max_batch in (1, 3):
+        algo = CatAlgorithm(1000, 1000, N, 5, 15, seed=42, max_batch=max_batch)
+        algo.start()
+
+        states = np.ones((3, N), dtype=int)
+        algo.get_states_batch(points, states)
+        results.append(states)
+
+    assert (results[0] == 2).any(), "Cats should hiss"
+    assert np.array_equal(results[0], results[1])
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_warm_up_keeps_results(incremental):
+    ti.init(arch=ti.gpu)
+
+    N = 5000
+    points = np.random.randint(0, 1000, size=(2, N))
+
+    results = {}
+    for warm_up in (False, True):
+        for distance_fun in (0, 1):
+            algo = CatAlgorithm(
+                1000,
+                1000,
+                N,
+                5,
+                15,
+                seed=42,
+                incremental=incremental,
+                distance_fun=distance_fun,
+            )
+            algo.start()
+            if warm_up:
+                algo.warm_up()
+                # one warmed up instance switches between the distance functions
+                algo.distance_fun = 1 - distance_fun
+                algo.get_states(points, np.ones(N, dtype=int), frame=0)
+                algo.distance_fun = distance_fun
+
+            states = np.ones(N, dtype=int)
+            algo.get_states(points, states, frame=1)
+            results[warm_up, distance_fun] = states
+
+    assert not np.array_equal(results[False, 0], results[False, 1])
+    for distance_fun in (0, 1):
+        assert np.array_equal(results[False, distance_fun], results[True, distance_fun])
+
+
+@pytest.mark.parametrize("symmetric", [False, True])
+@pytest.mark.parametrize("exact", [False, True])
+def test_configure_matches_new_instance(exact, symmetric):
+    ti.init(arch=ti.gpu)
+
+    N = 5000
+    points = np.random.randint(0, 1000, size=(2, N))
+    params = dict(seed=42, exact=exact, symmetric=symmetric, cell_size=15)
+
+    algo = CatAlgorithm(1000, 1000, N, 5, 15, **params)
+    algo.start()
+    algo.get_states(points, np.ones(N, dtype=int))
+
+    # (distance_fun, R0, R1), hissing is impossible in the last one
+    for distance_fun, R0, R1 in [(1, 5, 15), (1, 10, 12), (2, 3, 20), (0, 8, 4)]:
+        algo.configure(distance_fun=distance_fun, R0=R0, R1=R1)
+        states = np.ones(N, dtype=int)
+        algo.get_states(points, states, frame=1)
+
+        new_algo = CatAlgorithm(
+            1000, 1000, N, R0, R1, distance_fun=distance_fun, **params
+        )
+        new_algo.start()
+        expected = np.ones(N, dtype=int)
+        new_algo.get_states(points, expected, frame=1)
+
+        assert np.array_equal(states, expected)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_restart_after_destroy(incremental):
+    ti.init(arch=ti.gpu)
+
+    N = 5000
+    points = np.random.randint(0, 1000, size=(2, N))
+    algo = CatAlgorithm(1000, 1000, N, 5, 15, seed=42, incremental=incremental)
+
+    results = []
+    for _ in range(3):
+        # e.g. a processor worker frees the fields of a replaced algorithm
+        algo.start()
+        states = np.ones(N, dtype=int)
+        algo.get_states(points, states, frame=1)
+        algo.destroy()
+        results.append(states)
+
+    assert np.array_equal(results[0], results[1])
+    assert np.array_equal(results[0], results[2])
+
+
+def test_hash_uniform_stays_below_one():
+    ti.init(arch=ti.gpu)
+
+    @ti.kernel
+    def uniform(h: ti.u32) -> ti.f64:
+        return hash_uniform(h)
+
+    assert uniform(0) == 0
+    # the largest hashes must not round up to 1.0
+    assert uniform(2**32 - 1) < 1
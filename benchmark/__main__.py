@@ -0,0 +1,294 @@
+"""Headless benchmark of the generator, the algorithm and the processor
+
+Sweeps number of cats, R0/R1, map size, distance function, number of walls and
+grid cell size, prints latency percentiles and throughput of every stage and
+writes them to JSON. The grid stage times only the build of the cell grid.
+With --suite runs one of the comparisons of implementation variants instead
+(the benchmark/<suite>.py scripts).
+
+Run from the repository root:
+    python -m benchmark --sizes 50000 500000 --walls 0 100 --output results.json
+    python -m benchmark --stages grid --cell-sizes 2 5 25 100
+    python -m benchmark --suite exact
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+import taichi as ti
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import BasicState, CatAlgorithm, DistanceFunction
+from benchmark.common import SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor, CatState
+
+STAGES = ["processor", "generator", "algorithm", "grid"]
+DEFAULT_STAGES = ["processor", "generator", "algorithm"]
+DISTANCES = {
+    "euclidean": DistanceFunction.EUCLIDEAN,
+    "manhattan": DistanceFunction.MANHATTAN,
+    "chebyshev": DistanceFunction.CHEBYSHEV,
+}
+PERCENTILES = [50, 95, 99]
+# comparisons of implementation variants, every one is a benchmark/<suite>.py
+SUITES = [
+    "deltas",
+    "distance",
+    "dtypes",
+    "exact",
+    "grid",
+    "lookahead",
+    "pipeline",
+    "reconfigure",
+    "render",
+    "replay",
+    "startup",
+    "symmetric",
+    "transport",
+]
+WALL_LENGTH = 100  # max length of random walls
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--radii",
+        nargs="+",
+        default=["5:15"],
+        help="R0:R1 pairs of fight and hiss distances",
+    )
+    parser.add_argument(
+        "--borders", nargs="+", default=["1500x1000"], help="map sizes, WxH"
+    )
+    parser.add_argument(
+        "--distances", nargs="+", choices=list(DISTANCES), default=["euclidean"]
+    )
+    parser.add_argument("--walls", type=int, nargs="+", default=[0])
+    parser.add_argument(
+        "--cell-sizes",
+        type=float,
+        nargs="+",
+        default=[None],
+        help="grid cell sizes (R1 by default)",
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=DEFAULT_STAGES)
+    parser.add_argument("--frames", type=int, default=20, help="measured frames")
+    parser.add_argument(
+        "--warmup", type=int, default=3, help="frames skipped before measuring"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument(
+        "--suite", choices=SUITES, help="run a comparison instead of the sweep"
+    )
+    return parser.parse_args(argv)
+
+
+def configurations(args):
+    """Yield every combination of the swept parameters."""
+    for N, radii, borders, distance, walls, cell_size in itertools.product(
+        args.sizes,
+        args.radii,
+        args.borders,
+        args.distances,
+        args.walls,
+        args.cell_sizes,
+    ):
+        R0, R1 = (int(radius) for radius in radii.split(":"))
+        x_border, y_border = (int(border) for border in borders.split("x"))
+        yield {
+            "N": N,
+            "R0": R0,
+            "R1": R1,
+            "x_border": x_border,
+            "y_border": y_border,
+            "distance": distance,
+            "walls": walls,
+            "cell_size": R1 if cell_size is None else cell_size,
+        }
+
+
+def create_generator(config, seed):
+    generator = CatGenerator(
+        config["N"], R, config["x_border"], config["y_border"], seed=seed
+    )
+
+    rng = np.random.default_rng(seed)
+    for _ in range(config["walls"]):
+        x, y = rng.uniform(0, config["x_border"]), rng.uniform(0, config["y_border"])
+        dx, dy = rng.uniform(-WALL_LENGTH, WALL_LENGTH, size=2)
+        generator.add_bad_border((x, y), (x + dx, y + dy))
+
+    return generator
+
+
+def create_algorithm(config, seed):
+    return CatAlgorithm(
+        config["x_border"],
+        config["y_border"],
+        config["N"],
+        config["R0"],
+        config["R1"],
+        distance_fun=DISTANCES[config["distance"]],
+        seed=seed,
+        cell_size=config["cell_size"],
+    )
+
+
+def measure(step, frames, warmup):
+    """Call step() warmup + frames times and return latencies of measured calls."""
+    for _ in range(warmup):
+        step()
+
+    latencies = []
+    for _ in range(frames):
+        start = perf_counter()
+        step()
+        latencies.append(perf_counter() - start)
+
+    return np.array(latencies)
+
+
+def bench_generator(config, args):
+    generator = create_generator(config, args.seed)
+    return measure(generator.update_cats, args.frames, args.warmup)
+
+
+def bench_algorithm(config, args, state=BasicState.WALK):
+    # a fresh runtime releases fields of previous configurations
+    ti.init(arch=ti.cpu)
+
+    generator = create_generator(config, args.seed)
+    algorithm = create_algorithm(config, args.seed)
+    algorithm.start()
+
+    positions = []
+    for _ in range(args.warmup + args.frames):
+        generator.update_cats()
+        positions.append(generator.cats.astype(int))
+    positions = iter(positions)
+    states = np.empty(config["N"], dtype=int)
+
+    def step():
+        states.fill(state)
+        algorithm.get_states(next(positions), states)
+
+    return measure(step, args.frames, args.warmup)
+
+
+def bench_grid(config, args):
+    # eating cats are skipped by the neighbour search, so only the grid is built
+    return bench_algorithm(config, args, state=CatState.EAT)
+
+
+def bench_processor(config, args):
+    processor = CatProcessor(
+        create_algorithm(config, args.seed),
+        create_generator(config, args.seed),
+        seed=args.seed,
+    )
+    processor.start()
+    try:
+        return measure(lambda: processor.data, args.frames, args.warmup)
+    finally:
+        processor.stop()
+
+
+BENCHMARKS = {
+    "processor": bench_processor,
+    "generator": bench_generator,
+    "algorithm": bench_algorithm,
+    "grid": bench_grid,
+}
+
+
+def summarize(latencies, N):
+    total = latencies.sum()
+    return {
+        "frames": len(latencies),
+        "latency_ms": {
+            "mean": latencies.mean() * 1000,
+            **{f"p{q}": np.percentile(latencies, q) * 1000 for q in PERCENTILES},
+        },
+        "fps": len(latencies) / total if total > 0 else None,
+        "cats_per_sec": len(latencies) * N / total if total > 0 else None,
+    }
+
+
+def environment():
+    """Describe the code version and the machine results were obtained on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "taichi": ".".join(str(part) for part in ti.__version__),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.suite is not None:
+        importlib.import_module(f"benchmark.{args.suite}").main()
+        return
+
+    results = []
+
+    header = f"{'stage':>10} {'N':>8} {'R0:R1':>7} {'map':>10} {'distance':>10} "
+    header += f"{'walls':>6} {'cell':>6} {'fps':>8} {'mean ms':>8}"
+    header += "".join(f" {f'p{q} ms':>8}" for q in PERCENTILES)
+    print(header)
+
+    # CatProcessor forks workers, so it runs before Taichi is initialized here
+    for stage in (stage for stage in STAGES if stage in args.stages):
+        for config in configurations(args):
+            summary = summarize(BENCHMARKS[stage](config, args), config["N"])
+            results.append({"stage": stage, **config, **summary})
+
+            latency = summary["latency_ms"]
+            radii = f"{config['R0']}:{config['R1']}"
+            borders = f"{config['x_border']}x{config['y_border']}"
+            print(
+                f"{stage:>10} {config['N']:>8} {radii:>7} {borders:>10} "
+                f"{config['distance']:>10} {config['walls']:>6} "
+                f"{config['cell_size']:>6g} {summary['fps']:>8.2f} {latency['mean']:>8.2f}"
+                + "".join(f" {latency[f'p{q}']:>8.2f}" for q in PERCENTILES)
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {"environment": environment(), "results": results}, file, indent=2
+            )
+        print(f"Results are written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Parameters shared by the benchmarks"""
+
+SIZES = [50_000, 500_000]  # number of cats
+BORDERS = (1500, 1000)
+R, R0, R1 = 5, 5, 15  # cat step, fight and hiss distances
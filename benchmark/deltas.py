@@ -0,0 +1,87 @@
+"""Benchmark of CatProcessor frames with full states and with state deltas
+
+Run from the repository root:
+    python -m benchmark.deltas
+"""
+
+import os
+import pickle
+import sys
+from time import perf_counter
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor
+
+# CatProcessor prepares up to max_size frames in advance during warm up
+WARMUP_FRAMES = 25
+FRAMES = 30
+COORDS_DTYPE, STATES_DTYPE = np.uint16, np.uint8
+
+
+def run(N: int, delta_states: bool, frames: int = FRAMES):
+    """Return frames/sec, mean pickled frame size (bytes, what the queue sends),
+    mean pickled states size and the share of keyframes."""
+    processor = CatProcessor(
+        CatAlgorithm(*BORDERS, N, R0, R1),
+        CatGenerator(N, R, *BORDERS),
+        coords_dtype=COORDS_DTYPE,
+        states_dtype=STATES_DTYPE,
+        delta_states=delta_states,
+    )
+    processor.start()
+
+    try:
+        for _ in range(WARMUP_FRAMES):
+            processor.data
+
+        received = []
+        start = perf_counter()
+        for _ in range(frames):
+            received.append(processor.data)
+        total = perf_counter() - start
+    finally:
+        processor.stop()
+
+    frame_bytes = np.mean([len(pickle.dumps(cats_data)) for cats_data in received])
+    states_bytes = np.mean(
+        [
+            len(
+                pickle.dumps(
+                    (
+                        cats_data.states,
+                        cats_data.changed_ids,
+                        cats_data.changed_mask,
+                        cats_data.changed_states,
+                    )
+                )
+            )
+            for cats_data in received
+        ]
+    )
+    keyframes = np.mean([cats_data.is_keyframe for cats_data in received])
+    return frames / total, frame_bytes, states_bytes, keyframes
+
+
+def main():
+    print(
+        f"{'N':>8} {'states':>7} {'fps':>8} {'frame KB':>9} {'states KB':>10} "
+        f"{'keyframes':>10}"
+    )
+    for N in SIZES:
+        for delta_states in (False, True):
+            fps, frame_bytes, states_bytes, keyframes = run(N, delta_states)
+            name = "deltas" if delta_states else "full"
+            print(
+                f"{N:>8} {name:>7} {fps:>8.2f} {frame_bytes / 2**10:>9.1f} "
+                f"{states_bytes / 2**10:>10.1f} {keyframes:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Benchmark of CatAlgorithm kernel time per distance function and compute dtype
+
+Run from the repository root:
+    python -m benchmark.distance
+"""
+
+import itertools
+import os
+import sys
+
+import taichi as ti
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import DistanceFunction
+from benchmark.common import SIZES
+from benchmark.exact import FRAMES, WARMUP_FRAMES, positions, run
+
+DISTANCES = {
+    "euclidean": DistanceFunction.EUCLIDEAN,
+    "manhattan": DistanceFunction.MANHATTAN,
+    "chebyshev": DistanceFunction.CHEBYSHEV,
+}
+COMPUTE_DTYPES = {"f64": ti.f64, "f32": ti.f32}
+
+
+def main():
+    ti.init(arch=ti.cpu)
+
+    print(f"{'N':>8} {'search':>7} {'distance':>10} {'dtype':>6} {'ms':>8}")
+    for N, exact in itertools.product(SIZES, (False, True)):
+        frames = positions(N, "uniform", WARMUP_FRAMES + FRAMES)
+        for (name, distance_fun), (dtype_name, dtype) in itertools.product(
+            DISTANCES.items(), COMPUTE_DTYPES.items()
+        ):
+            ms, _ = run(
+                frames, exact, False, distance_fun=distance_fun, compute_dtype=dtype
+            )
+            search = "exact" if exact else "capped"
+            print(f"{N:>8} {search:>7} {name:>10} {dtype_name:>6} {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark of CatProcessor frames with default and compact dtypes
+
+Run from the repository root:
+    python -m benchmark.dtypes
+"""
+
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor
+
+# CatProcessor prepares up to max_size frames in advance during warm up
+WARMUP_FRAMES = 25
+FRAMES = 30
+DTYPES = {
+    "int64/int64": (np.int64, np.int64),
+    "float32/uint8": (np.float32, np.uint8),
+    "uint16/uint8": (np.uint16, np.uint8),
+}
+
+
+def frame_size(N: int, coords_dtype, states_dtype) -> int:
+    """Return bytes of coordinates and states of one frame."""
+    return 2 * N * np.dtype(coords_dtype).itemsize + N * np.dtype(states_dtype).itemsize
+
+
+def run(N: int, coords_dtype, states_dtype, frames: int = FRAMES):
+    """Return frames/sec and mean algorithm kernel time (ms)."""
+    processor = CatProcessor(
+        CatAlgorithm(*BORDERS, N, R0, R1),
+        CatGenerator(N, R, *BORDERS),
+        coords_dtype=coords_dtype,
+        states_dtype=states_dtype,
+    )
+    processor.start()
+
+    try:
+        for _ in range(WARMUP_FRAMES):
+            processor.data
+
+        start = perf_counter()
+        for _ in range(frames):
+            processor.data
+        total = perf_counter() - start
+
+        kernel_ms = processor.metrics["kernel"]["mean_ms"]
+    finally:
+        processor.stop()
+
+    return frames / total, kernel_ms
+
+
+def main():
+    print(f"{'N':>8} {'dtypes':>14} {'frame MB':>9} {'fps':>8} {'kernel ms':>10}")
+    for N in SIZES:
+        for name, dtypes in DTYPES.items():
+            size = frame_size(N, *dtypes) / 2**20
+            fps, kernel_ms = run(N, *dtypes)
+            print(f"{N:>8} {name:>14} {size:>9.2f} {fps:>8.2f} {kernel_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark of the exact neighbour search against the capped one on clustered cats
+
+Cats are spread uniformly or gathered into Gaussian blobs, where neighbour cells
+hold far more than `limit_per_cell` cats.
+
+Run from the repository root:
+    python -m benchmark.exact
+"""
+
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+import taichi as ti
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import BasicState, CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES
+
+WARMUP_FRAMES = 2
+FRAMES = 10
+BLOBS = 20
+BLOB_SIGMA = 40  # px
+STEP = 2  # px, cats move a bit between frames
+EAT = 4  # CatState.EAT, kept by the algorithm
+
+
+def positions(N: int, layout: str, frames: int, seed: int = 0):
+    """Return `frames` consecutive int positions of N cats."""
+    rng = np.random.default_rng(seed)
+    borders = np.array(BORDERS)[:, None]
+    if layout == "uniform":
+        points = rng.uniform(0, borders, size=(2, N))
+    else:
+        centers = rng.uniform(0.1 * borders, 0.9 * borders, size=(2, BLOBS))
+        points = centers[:, rng.integers(0, BLOBS, N)]
+        points += rng.normal(0, BLOB_SIGMA, size=(2, N))
+
+    result = []
+    for _ in range(frames):
+        points = np.clip(points + rng.normal(0, STEP, size=(2, N)), 0, borders - 1)
+        result.append(points.astype(int))
+    return result
+
+
+def run(
+    frames,
+    exact: bool,
+    incremental: bool,
+    R0=R0,
+    R1=R1,
+    kept: float = 0.0,
+    **algo_kwargs,
+):
+    """Return mean get_states() time (ms) and states of the last frame.
+
+    A `kept` share of cats (the same ones in every frame) is eating, like
+    sleeping, eating and wall-hit cats of generator frames.
+    """
+    N = frames[0].shape[1]
+    rng = np.random.default_rng(0)
+    initial = np.full(N, BasicState.WALK)
+    initial[rng.random(N) < kept] = EAT
+    algorithm = CatAlgorithm(
+        *BORDERS,
+        N,
+        R0,
+        R1,
+        incremental=incremental,
+        seed=0,
+        exact=exact,
+        **algo_kwargs,
+    )
+    algorithm.start()
+
+    states = np.empty(N, dtype=int)
+    total = 0.0
+    for i, points in enumerate(frames):
+        states[:] = initial
+        start = perf_counter()
+        algorithm.get_states(points, states)
+        if i >= WARMUP_FRAMES:
+            total += perf_counter() - start
+
+    return total / (len(frames) - WARMUP_FRAMES) * 1000, states
+
+
+def main():
+    ti.init(arch=ti.cpu)
+
+    print(
+        f"{'N':>8} {'layout':>8} {'grid':>12} {'capped ms':>10} {'exact ms':>9} "
+        f"{'diff %':>7}"
+    )
+    for N in SIZES:
+        for layout in ("uniform", "blobs"):
+            frames = positions(N, layout, WARMUP_FRAMES + FRAMES)
+            for incremental in (False, True):
+                capped_ms, capped = run(frames, False, incremental)
+                exact_ms, exact = run(frames, True, incremental)
+                # share of cats whose state the cap got wrong
+                diff = np.mean(capped != exact) * 100
+                grid = "incremental" if incremental else "rebuilt"
+                print(
+                    f"{N:>8} {layout:>8} {grid:>12} {capped_ms:>10.2f} "
+                    f"{exact_ms:>9.2f} {diff:>7.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark of CatAlgorithm grid cell sizes and of the cell size tuner
+
+With the capped search (`limit_per_cell`) larger cells also check fewer cats,
+the exact search gives the same states with any cell size.
+
+Run from the repository root:
+    python -m benchmark.grid
+"""
+
+import itertools
+import os
+import sys
+
+import taichi as ti
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CELL_SIZE_FACTORS, time_cell_sizes
+from benchmark.common import BORDERS, R0, R1, SIZES
+
+CONFIGS = {
+    "default": (BORDERS, R0, R1),
+    "R1 << R0": (BORDERS, 15, 3),
+    "huge map": ((15_000, 10_000), R0, R1),
+}
+
+
+def main():
+    ti.init(arch=ti.cpu)
+
+    print(f"{'N':>8} {'config':>10} {'search':>7} {'cell':>6} {'cells':>9} {'ms':>8}")
+    for N, (name, (borders, r0, r1)), exact in itertools.product(
+        SIZES, CONFIGS.items(), (False, True)
+    ):
+        radius = max(r0, r1)
+        # R1 is the default cell size, the rest are the tuner candidates
+        cell_sizes = sorted({r1, *(radius * f for f in CELL_SIZE_FACTORS)})
+        times = time_cell_sizes(*borders, N, r0, r1, cell_sizes=cell_sizes, exact=exact)
+
+        best = min(times, key=times.get)
+        search = "exact" if exact else "capped"
+        for cell_size, seconds in times.items():
+            cells = (int(borders[0] / cell_size) + 1) * (
+                int(borders[1] / cell_size) + 1
+            )
+            mark = " <- tuned" if cell_size == best else ""
+            mark += " (default)" if cell_size == r1 else ""
+            print(
+                f"{N:>8} {name:>10} {search:>7} {cell_size:>6g} {cells:>9} "
+                f"{seconds * 1000:>8.2f}{mark}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark of the fixed and the adaptive CatProcessor lookahead
+
+A slow consumer (like the UI, which interpolates between frames) takes frames
+and then pauses. Frames produced in advance cost CPU time and memory.
+
+Run from the repository root:
+    python -m benchmark.lookahead
+"""
+
+import os
+import sys
+from time import perf_counter, sleep
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor
+
+MAX_SIZE = 10
+CONSUMER_INTERVAL = 0.5  # sec between frames taken by the slow consumer
+FRAMES = 10
+PAUSE = 3  # sec
+LOOKAHEADS = {
+    "fixed": MAX_SIZE,  # min_lookahead == max_size never adapts
+    "adaptive": 2,
+}
+
+
+def run(N: int, min_lookahead: int):
+    """Return frames produced in advance (after consuming and after the pause),
+    the last lookahead and fps of a fast consumer."""
+    processor = CatProcessor(
+        CatAlgorithm(*BORDERS, N, R0, R1),
+        CatGenerator(N, R, *BORDERS),
+        max_size=MAX_SIZE,
+        coords_dtype=np.uint16,
+        states_dtype=np.uint8,
+        min_lookahead=min_lookahead,
+    )
+    processor.start()
+
+    try:
+        for _ in range(FRAMES):
+            processor.data
+            sleep(CONSUMER_INTERVAL)
+        ahead = processor.metrics["generate"]["count"] - FRAMES
+        lookahead = processor.lookahead
+
+        processor.pause()
+        sleep(PAUSE)
+        paused_ahead = processor.metrics["generate"]["count"] - FRAMES
+        processor.resume()
+
+        # drain frames produced in advance, so only the throughput is measured
+        for _ in range(MAX_SIZE):
+            processor.data
+
+        start = perf_counter()
+        for _ in range(FRAMES):
+            processor.data
+        fps = FRAMES / (perf_counter() - start)
+    finally:
+        processor.stop()
+
+    return ahead, paused_ahead, lookahead, fps
+
+
+def main():
+    print(
+        f"{'N':>8} {'lookahead':>10} {'ahead':>6} {'paused':>7} "
+        f"{'last':>5} {'fast fps':>9}"
+    )
+    for N in SIZES:
+        for name, min_lookahead in LOOKAHEADS.items():
+            ahead, paused_ahead, lookahead, fps = run(N, min_lookahead)
+            print(
+                f"{N:>8} {name:>10} {ahead:>6} {paused_ahead:>7} "
+                f"{lookahead:>5} {fps:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
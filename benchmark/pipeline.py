@@ -0,0 +1,59 @@
+"""Benchmark of the multiprocess CatProcessor against the fused in-process pipeline
+
+Run from the repository root:
+    python -m benchmark.pipeline
+"""
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor, FusedCatProcessor
+
+# CatProcessor prepares up to max_size frames in advance during warm up
+WARMUP_FRAMES = 25
+FRAMES = 30
+PIPELINES = {
+    "processes": lambda algo, gen: CatProcessor(algo, gen),
+    "fused": lambda algo, gen: FusedCatProcessor(algo, gen, double_buffering=False),
+    "fused x2": lambda algo, gen: FusedCatProcessor(algo, gen, double_buffering=True),
+}
+
+
+def run(N: int, pipeline: str, frames: int = FRAMES):
+    """Return frames/sec achieved by the pipeline."""
+    processor = PIPELINES[pipeline](
+        CatAlgorithm(*BORDERS, N, R0, R1), CatGenerator(N, R, *BORDERS)
+    )
+    processor.start()
+
+    try:
+        # skip kernel compilation and frames prepared in advance
+        for _ in range(WARMUP_FRAMES):
+            processor.data
+
+        start = perf_counter()
+        for _ in range(frames):
+            processor.data
+        total = perf_counter() - start
+    finally:
+        processor.stop()
+
+    return frames / total
+
+
+def main():
+    print(f"{'N':>8} {'pipeline':>10} {'fps':>8}")
+    # processes are forked before the fused pipelines initialize Taichi here
+    for pipeline in PIPELINES:
+        for N in SIZES:
+            print(f"{N:>8} {pipeline:>10} {run(N, pipeline):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
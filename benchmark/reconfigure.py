@@ -0,0 +1,72 @@
+"""Benchmark of changing CatProcessor parameters: restart against reconfigure
+with new algorithm and generator objects and against a parameter update of
+the running algorithm
+
+Measures time from the change of the distance function to the first frame
+with the new one.
+
+Run from the repository root:
+    python -m benchmark.reconfigure
+"""
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm, DistanceFunction
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor
+
+DISTANCES = [
+    DistanceFunction.MANHATTAN,
+    DistanceFunction.CHEBYSHEV,
+    DistanceFunction.EUCLIDEAN,
+]
+
+
+def create(N: int, distance_fun: int):
+    return CatAlgorithm(*BORDERS, N, R0, R1, distance_fun=distance_fun), CatGenerator(
+        N, R, *BORDERS
+    )
+
+
+def run(N: int, mode: str):
+    """Return mean time (sec) from a parameter change to the next frame."""
+    # kernels of every distance function are compiled before the first frame,
+    # as the UI does, so only the change itself is measured
+    processor = CatProcessor(*create(N, DistanceFunction.EUCLIDEAN), warm_up=True)
+    processor.start()
+    processor.data
+
+    times = []
+    for distance_fun in DISTANCES:
+        start = perf_counter()
+        if mode == "restart":
+            processor.stop()
+            processor = CatProcessor(*create(N, distance_fun), warm_up=True)
+            processor.start()
+        elif mode == "reconfigure":
+            processor.reconfigure(*create(N, distance_fun))
+        else:
+            processor.reconfigure(algo_params={"distance_fun": distance_fun})
+        processor.data
+        times.append(perf_counter() - start)
+
+    processor.stop()
+    return sum(times) / len(times)
+
+
+def main():
+    print(f"{'N':>8} {'restart s':>10} {'reconfigure s':>14} {'params s':>9}")
+    for N in SIZES:
+        print(
+            f"{N:>8} {run(N, 'restart'):>10.2f} {run(N, 'reconfigure'):>14.2f} "
+            f"{run(N, 'params'):>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark of cats rendering in both draw styles
+
+Run from the repository root (no window is opened):
+    python -m benchmark.render
+"""
+
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.append(os.getcwd())
+
+import pygame
+
+from benchmark.common import SIZES
+from ui.cat_drawer import RES, DrawStyle, draw_cats, draw_density
+from ui.resources import init_pygame_pictures
+
+FRAMES = 10
+STYLES = {
+    "dots": DrawStyle.DOTS,
+    "pictures": DrawStyle.PICTURES,
+    "density": draw_density,
+}
+
+
+def run(window_surface, N: int, draw_method, frames: int = FRAMES):
+    """Return average time (sec) to draw one frame of N cats."""
+    coords1 = np.vstack(
+        (np.random.randint(0, RES[0], N), np.random.randint(0, RES[1], N))
+    )
+    coords2 = coords1 + np.random.randint(-5, 5, size=(2, N))
+    states = np.random.randint(1, 7, size=N)
+    food = np.random.uniform(0, RES[1], size=(2, 10))
+
+    start = perf_counter()
+    for _ in range(frames):
+        window_surface.fill((0, 0, 0))
+        draw_cats(
+            coords1,
+            coords2,
+            (coords1 + coords2) / 2,
+            states,
+            window_surface,
+            [],
+            food,
+            draw_method,
+            lod_threshold=N + 1,  # measure the style itself
+        )
+    return (perf_counter() - start) / frames
+
+
+def main():
+    pygame.init()
+    window_surface = pygame.display.set_mode(RES)
+    init_pygame_pictures()
+
+    print(f"{'N':>8} {'style':>10} {'ms':>8}")
+    for N in SIZES:
+        for name, draw_method in STYLES.items():
+            frame_time = run(window_surface, N, draw_method)
+            print(f"{N:>8} {name:>10} {frame_time * 1000:>8.2f}")
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark of playing recorded frames back against computing them live
+
+Run from the repository root:
+    python -m benchmark.replay
+"""
+
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor
+from processor.recording import FrameRecorder, FrameReplay
+
+WARMUP_FRAMES = 3
+FRAMES = 30
+
+
+def fps(source, frames: int = FRAMES):
+    """Return frames/sec of reading frames (and touching their data)."""
+    for _ in range(WARMUP_FRAMES):
+        source.data
+
+    start = perf_counter()
+    for _ in range(frames):
+        coords, states, food = source.data.unpack()
+        # memory-mapped frames are read lazily, so make the replay read them
+        coords.sum(), states.sum()
+    return frames / (perf_counter() - start)
+
+
+def run(N: int, path: str):
+    """Return fps of the live processor and of the replay of its recording."""
+    generator = CatGenerator(N, R, *BORDERS)
+    processor = CatProcessor(CatAlgorithm(*BORDERS, N, R0, R1), generator)
+    processor.start()
+    try:
+        live = fps(processor)
+        with FrameRecorder(path, N, generator.food.shape[1]) as recorder:
+            recorder.record(processor, WARMUP_FRAMES + FRAMES)
+    finally:
+        processor.stop()
+
+    replay = FrameReplay(path)
+    replay.start()
+    try:
+        return live, fps(replay)
+    finally:
+        replay.stop()
+
+
+def main():
+    print(f"{'N':>8} {'live fps':>10} {'replay fps':>11} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cats.rec")
+        for N in SIZES:
+            live, replay = run(N, path)
+            size = os.path.getsize(path) / 2**20
+            print(f"{N:>8} {live:>10.2f} {replay:>11.2f} {size:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark of the algorithm cold start with and without the Taichi offline cache
+
+Every start runs in a fresh process: Taichi initialization, compilation of all
+kernel variants (CatAlgorithm.warm_up) and the first frame.
+
+Run from the repository root:
+    python -m benchmark.startup
+"""
+
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import taichi as ti
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm, init_taichi
+from benchmark.common import BORDERS, R0, R1
+
+N = 50_000
+
+
+def cold_start(cache_dir: str | None):
+    """Return seconds spent on init, warm up and the first frame."""
+    start = perf_counter()
+    init_taichi(cache_dir=cache_dir)
+    initialized = perf_counter()
+
+    algorithm = CatAlgorithm(*BORDERS, N, R0, R1)
+    algorithm.start()
+    algorithm.warm_up()
+    warmed_up = perf_counter()
+
+    cats = np.random.randint(0, min(BORDERS), size=(2, N))
+    algorithm.get_states(cats, np.ones(N, dtype=int))
+    first_frame = perf_counter()
+
+    ti.reset()  # writes compiled kernels to the offline cache
+    return initialized - start, warmed_up - initialized, first_frame - warmed_up
+
+
+def main():
+    # a fresh process for every start, so nothing is compiled in advance
+    context = mp.get_context("spawn")
+
+    print(f"{'cache':>6} {'init s':>7} {'warm up s':>10} {'frame s':>8} {'total s':>8}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, directory in (
+            ("none", None),
+            ("cold", cache_dir),
+            ("warm", cache_dir),
+        ):
+            with context.Pool(1) as pool:
+                times = pool.apply(cold_start, (directory,))
+            print(
+                f"{name:>6} "
+                + " ".join(f"{t:>{w}.2f}" for t, w in zip(times, (7, 10, 8)))
+                + f" {sum(times):>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
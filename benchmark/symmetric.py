@@ -0,0 +1,50 @@
+"""Benchmark of the per-cat neighbour search against the symmetric pair pass
+
+Run from the repository root:
+    python -m benchmark.symmetric
+"""
+
+import itertools
+import os
+import sys
+
+import numpy as np
+import taichi as ti
+
+sys.path.append(os.getcwd())
+
+from benchmark.common import R0, R1, SIZES
+from benchmark.exact import FRAMES, WARMUP_FRAMES, positions, run
+
+# R0:R1 pairs, a wide fight radius gives more pairs for the symmetric pass
+RADII = [(R0, R1), (10, 15)]
+# shares of cats with kept states, real frames always have some
+KEPT = (0.0, 0.1)
+
+
+def main():
+    ti.init(arch=ti.cpu)
+
+    print(
+        f"{'N':>8} {'layout':>8} {'R0:R1':>6} {'kept %':>6} {'search':>7} "
+        f"{'per cat ms':>11} {'pairs ms':>9} {'speedup':>8} {'diff %':>7}"
+    )
+    for N, layout, (r0, r1), kept, exact in itertools.product(
+        SIZES, ("uniform", "blobs"), RADII, KEPT, (False, True)
+    ):
+        frames = positions(N, layout, WARMUP_FRAMES + FRAMES)
+        params = dict(R0=r0, R1=r1, kept=kept)
+        per_cat_ms, per_cat = run(frames, exact, False, **params)
+        pairs_ms, pairs = run(frames, exact, False, symmetric=True, **params)
+        # the capped search checks other cats of crowded cells in the pair pass
+        diff = np.mean(per_cat != pairs) * 100
+        search = "exact" if exact else "capped"
+        print(
+            f"{N:>8} {layout:>8} {f'{r0}:{r1}':>6} {kept * 100:>6.0f} {search:>7} "
+            f"{per_cat_ms:>11.2f} {pairs_ms:>9.2f} {per_cat_ms / pairs_ms:>8.2f} "
+            f"{diff:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
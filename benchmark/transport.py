@@ -0,0 +1,62 @@
+"""Benchmark of CatProcessor frame transports (pickling queues vs shared memory)
+
+Run from the repository root:
+    python -m benchmark.transport
+"""
+
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from algorithm.algorithm import CatAlgorithm
+from benchmark.common import BORDERS, R0, R1, SIZES, R
+from generator.generator import CatGenerator
+from processor.processor import CatProcessor
+
+WARMUP_FRAMES = 3
+FRAMES = 30
+
+
+def run(N: int, use_shared_memory: bool, frames: int = FRAMES):
+    """Return achieved frames/sec and latencies (sec) of every `data` call."""
+    generator = CatGenerator(N, R, *BORDERS)
+    algorithm = CatAlgorithm(*BORDERS, N, R0, R1)
+    processor = CatProcessor(algorithm, generator, use_shared_memory=use_shared_memory)
+    processor.start()
+
+    try:
+        # skip kernel compilation and filling of the queues
+        for _ in range(WARMUP_FRAMES):
+            processor.data
+
+        latencies = []
+        start = perf_counter()
+        for _ in range(frames):
+            frame_start = perf_counter()
+            processor.data
+            latencies.append(perf_counter() - frame_start)
+        total = perf_counter() - start
+    finally:
+        processor.stop()
+
+    return frames / total, np.array(latencies)
+
+
+def main():
+    print(f"{'N':>8} {'transport':>10} {'fps':>8} {'mean ms':>8} {'p95 ms':>8}")
+    for N in SIZES:
+        for use_shared_memory in (False, True):
+            fps, latencies = run(N, use_shared_memory)
+            print(
+                f"{N:>8} {'shm' if use_shared_memory else 'queue':>10} {fps:>8.2f} "
+                f"{latencies.mean() * 1000:>8.2f} "
+                f"{np.percentile(latencies, 95) * 1000:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,23 @@
 from abc import abstractmethod
-import random
 from typing import Tuple
 
 import numpy as np
+import taichi as ti
+
+from algorithm.hashing import hash_uniform, pcg_hash
 
 
 class AbstractCatGenerator:
+    uses_taichi = False  # whether Taichi has to be initialized before start()
+
+    def start(self):
+        """Prepare the generator in the process which will update cats."""
+        pass
+
+    def destroy(self):
+        """Free resources (e.g. Taichi fields) allocated by start()."""
+        pass
+
     @property
     @abstractmethod
     def N(self):
@@ -44,37 +56,28 @@ class AbstractCatGenerator:
     def add_bad_border(self, a: Tuple[int, int], b: Tuple[int, int]):
         pass
 
+    @abstractmethod
+    def reseed(self, seed):
+        """Restart the generator with random numbers from the seed."""
+        pass
+
 
 class CatGenerator(AbstractCatGenerator):
-    def __init__(self, N, R, x_border, y_border):
+    def __init__(self, N, R, x_border, y_border, seed=None, food_count=10):
         assert R < x_border and R < y_border
 
-        # random cat coordinates
-        x_array = np.random.uniform(0, x_border, size=(N))
-        y_array = np.random.uniform(0, y_border, size=(N))
-
         self.__CATS_COUNT = N
         self.__BORDER = {"x": x_border, "y": y_border}
         self.__RADIUS = R
-        self.__FOOD_COUNT = 10  # number of food pieces on the map at the same time
+        self.__FOOD_COUNT = (
+            food_count  # number of food pieces on the map at the same time
+        )
         self.__FOOD_SMELL_RADIUS = self.__RADIUS
 
-        # [[x_0, x_1, ...], [y_0, y_1, ...]]
-        self.__cat_coordinates = np.vstack((x_array, y_array))
-
-        self.__hit_cat_ids = np.array([])
-        self.__sleepy_cat_ids = np.array([])
-        self.__eating_cat_ids = np.array([])
-
-        x_food_coordinates = np.random.uniform(0, x_border, size=(self.__FOOD_COUNT))
-        y_food_coordinates = np.random.uniform(0, y_border, size=(self.__FOOD_COUNT))
-        self.__food_coordinates = np.vstack((x_food_coordinates, y_food_coordinates))
-
-        angle_array = np.random.uniform(0, 6.28, size=(N))
-        self.__cos_array = np.cos(angle_array)
-        self.__sin_array = np.sin(angle_array)
-
         self.__bad_border_coordinates = []
+        self.__walls_grid = None  # built on demand, see __build_walls_grid()
+
+        self.reseed(seed)
 
     @property
     def N(self):
@@ -108,16 +111,44 @@ class CatGenerator(AbstractCatGenerator):
 
     def add_bad_border(self, a: Tuple[int, int], b: Tuple[int, int]):
         self.__bad_border_coordinates.append([*a, *b])
+        self.__walls_grid = None
+
+    def reseed(self, seed):
+        """Place cats and food anew using random numbers from the seed."""
+        self.__rng = np.random.default_rng(seed)
+
+        # random cat coordinates
+        x_array = self.__rng.uniform(0, self.__BORDER["x"], size=(self.__CATS_COUNT))
+        y_array = self.__rng.uniform(0, self.__BORDER["y"], size=(self.__CATS_COUNT))
+
+        # [[x_0, x_1, ...], [y_0, y_1, ...]]
+        self.__cat_coordinates = np.vstack((x_array, y_array))
+
+        self.__hit_cat_ids = np.array([])
+        self.__sleepy_cat_ids = np.array([])
+        self.__eating_cat_ids = np.array([])
+
+        x_food_coordinates = self.__rng.uniform(
+            0, self.__BORDER["x"], size=(self.__FOOD_COUNT)
+        )
+        y_food_coordinates = self.__rng.uniform(
+            0, self.__BORDER["y"], size=(self.__FOOD_COUNT)
+        )
+        self.__food_coordinates = np.vstack((x_food_coordinates, y_food_coordinates))
+
+        angle_array = self.__rng.uniform(0, 6.28, size=(self.__CATS_COUNT))
+        self.__cos_array = np.cos(angle_array)
+        self.__sin_array = np.sin(angle_array)
 
     def __update_angles(self):
         """Randomly updates the angles of a cats subset.
 
         (Only a certain number of cats can change direction each turn)
         """
-        n = random.randint(0, self.__CATS_COUNT)
+        n = self.__rng.integers(0, self.__CATS_COUNT, endpoint=True)
 
-        cat_ids = np.random.choice(self.__CATS_COUNT, size=n, replace=False)
-        rads = np.random.uniform(0, 6.28, size=(n))
+        cat_ids = self.__rng.choice(self.__CATS_COUNT, size=n, replace=False)
+        rads = self.__rng.uniform(0, 6.28, size=(n))
         rads_cos = np.cos(rads)
         rads_sin = np.sin(rads)
 
@@ -131,8 +162,10 @@ class CatGenerator(AbstractCatGenerator):
         self.__hit_cat_ids = np.array([])
 
         ### get sleepy cats
-        sleepy_cats_count = random.randint(0, self.__CATS_COUNT // 10)
-        sleepy_cat_ids = np.random.choice(
+        sleepy_cats_count = self.__rng.integers(
+            0, self.__CATS_COUNT // 10, endpoint=True
+        )
+        sleepy_cat_ids = self.__rng.choice(
             self.__cat_coordinates[0].shape[0], sleepy_cats_count, replace=False
         )
         self.__sleepy_cat_ids = sleepy_cat_ids
@@ -141,53 +174,32 @@ class CatGenerator(AbstractCatGenerator):
         new_xs = xs + self.__RADIUS * self.__cos_array
         new_ys = ys + self.__RADIUS * self.__sin_array
 
-        ### look through all the bad borders
-        for x0, y0, x1, y1 in self.__bad_border_coordinates:
-            # find all intersections of cats with bad border
-            hit_ids, intersection_xs, intersection_ys = self.__find_intersections(
-                xs, ys, new_xs, new_ys, x0, y0, x1, y1
-            )
-            # ids -> id of cats that tried to intersect bad border
-
-            if hit_ids.size == 0:
-                continue
-
-            self.__hit_cat_ids = np.append(self.__hit_cat_ids, hit_ids)
-
-            # return back these cats (but with small offset otherwise they will get stuck at the border)
-            new_xs[hit_ids], new_ys[hit_ids] = self.__offset_points(
-                xs[hit_ids], ys[hit_ids], intersection_xs, intersection_ys
-            )
+        ### find cats which bump into the bad borders
+        hit_ids, intersection_xs, intersection_ys = self.__find_wall_hits(
+            xs, ys, new_xs, new_ys
+        )
+        self.__hit_cat_ids = hit_ids
 
-        self.__hit_cat_ids = np.unique(self.__hit_cat_ids)
+        # return back these cats (but with small offset otherwise they will get stuck at the border)
+        new_xs[hit_ids], new_ys[hit_ids] = self.__offset_points(
+            xs[hit_ids], ys[hit_ids], intersection_xs, intersection_ys
+        )
 
         ### find eating cats
-        food_xs, food_ys = self.__food_coordinates
-        for food_id, (food_x, food_y) in enumerate(zip(food_xs, food_ys)):
-            distances = np.sqrt(np.square(xs - food_x) + np.square(ys - food_y))
-            eating_cats_mask = distances < self.__FOOD_SMELL_RADIUS
+        eating_cat_ids, eaten_food_ids = self.__find_eating_cats(xs, ys)
+        self.__eating_cat_ids = eating_cat_ids
 
-            if eating_cats_mask.size <= 0:
-                continue
+        # stay at the same place
+        new_xs[eating_cat_ids] = xs[eating_cat_ids]
+        new_ys[eating_cat_ids] = ys[eating_cat_ids]
 
-            # stay at the same place
-            new_xs[eating_cats_mask] = xs[eating_cats_mask]
-            new_ys[eating_cats_mask] = ys[eating_cats_mask]
-
-            self.__eating_cat_ids = np.append(
-                self.__eating_cat_ids, np.where(eating_cats_mask)
-            )
-
-            # relocate food
-            (
-                self.__food_coordinates[0, food_id],
-                self.__food_coordinates[1, food_id],
-            ) = (
-                random.randint(0, self.__BORDER["x"]),
-                random.randint(0, self.__BORDER["y"]),
-            )
-
-        self.__eating_cat_ids = np.unique(self.__eating_cat_ids)
+        # relocate eaten food
+        self.__food_coordinates[0, eaten_food_ids] = self.__rng.integers(
+            0, self.__BORDER["x"], size=eaten_food_ids.size, endpoint=True
+        )
+        self.__food_coordinates[1, eaten_food_ids] = self.__rng.integers(
+            0, self.__BORDER["y"], size=eaten_food_ids.size, endpoint=True
+        )
 
         # put some of the cats to sleep
         new_xs[sleepy_cat_ids], new_ys[sleepy_cat_ids] = (
@@ -198,6 +210,160 @@ class CatGenerator(AbstractCatGenerator):
         # updates coordinates
         self.__cat_coordinates[0], self.__cat_coordinates[1] = new_xs, new_ys
 
+    def __build_walls_grid(self):
+        self.__walls_grid = build_walls_grid(
+            self.__bad_border_coordinates,
+            max(self.__RADIUS, 1),
+            self.__BORDER["x"],
+            self.__BORDER["y"],
+        )
+
+    def __find_wall_hits(self, xs, ys, new_xs, new_ys, max_pairs=1 << 22):
+        """Find cats whose trajectories cross walls and the nearest crossing points.
+
+        Candidate (cat, wall) pairs are tested in chunks of about `max_pairs`.
+        """
+        no_hits = np.array([], dtype=int), np.array([]), np.array([])
+        if not self.__bad_border_coordinates:
+            return no_hits
+        if self.__walls_grid is None:
+            self.__build_walls_grid()
+
+        grid = self.__walls_grid
+        x_cells, y_cells = grid["shape"]
+        cell_size = grid["cell_size"]
+
+        x_cells_from = np.clip((xs / cell_size).astype(int), 0, x_cells - 1)
+        x_cells_to = np.clip((new_xs / cell_size).astype(int), 0, x_cells - 1)
+        y_cells_from = np.clip((ys / cell_size).astype(int), 0, y_cells - 1)
+        y_cells_to = np.clip((new_ys / cell_size).astype(int), 0, y_cells - 1)
+        x_begin = np.minimum(x_cells_from, x_cells_to)
+        y_begin = np.minimum(y_cells_from, y_cells_to)
+
+        # only cats with walls nearby are tested further
+        candidate_ids = np.flatnonzero(grid["near_walls"][x_begin, y_begin])
+        if candidate_ids.size == 0:
+            return no_hits
+
+        x_begin, y_begin = x_begin[candidate_ids], y_begin[candidate_ids]
+        x_end = np.maximum(x_cells_from[candidate_ids], x_cells_to[candidate_ids])
+        y_end = np.maximum(y_cells_from[candidate_ids], y_cells_to[candidate_ids])
+
+        # trajectory is not longer than a cell, so it covers at most 2x2 cells
+        trajectory_cells, walls_counts = [], []
+        for dx in (0, 1):
+            for dy in (0, 1):
+                inside = (x_begin + dx <= x_end) & (y_begin + dy <= y_end)
+                cells = np.where(inside, (x_begin + dx) * y_cells + (y_begin + dy), 0)
+                trajectory_cells.append(cells)
+                walls_counts.append(np.where(inside, grid["walls_per_cell"][cells], 0))
+
+        trajectory_cells = np.stack(trajectory_cells)
+        walls_counts = np.stack(walls_counts)
+
+        # split candidates into chunks with a limited number of pairs
+        pairs_count = np.cumsum(walls_counts.sum(axis=0))
+        chunk_ends = np.searchsorted(
+            pairs_count, np.arange(max_pairs, pairs_count[-1], max_pairs)
+        )
+        chunks = np.split(np.arange(candidate_ids.size), chunk_ends)
+
+        hit_ids, hit_xs, hit_ys = [], [], []
+        for chunk in chunks:
+            cat_ids, wall_ids = [], []
+            for cells, counts in zip(
+                trajectory_cells[:, chunk], walls_counts[:, chunk]
+            ):
+                cat_ids.append(np.repeat(candidate_ids[chunk], counts))
+                wall_ids.append(
+                    grid["wall_ids"][expand_ranges(grid["cell_begins"][cells], counts)]
+                )
+            cat_ids, wall_ids = np.concatenate(cat_ids), np.concatenate(wall_ids)
+
+            x0, y0, x1, y1 = grid["walls"][wall_ids].T
+            ids, intersection_xs, intersection_ys = self.__find_intersections(
+                xs[cat_ids],
+                ys[cat_ids],
+                new_xs[cat_ids],
+                new_ys[cat_ids],
+                x0,
+                y0,
+                x1,
+                y1,
+            )
+            hit_ids.append(cat_ids[ids])
+            hit_xs.append(intersection_xs)
+            hit_ys.append(intersection_ys)
+
+        hit_ids = np.concatenate(hit_ids)
+        hit_xs, hit_ys = np.concatenate(hit_xs), np.concatenate(hit_ys)
+        if hit_ids.size == 0:
+            return no_hits
+
+        # every cat stops at the nearest wall on its way
+        distances = np.hypot(hit_xs - xs[hit_ids], hit_ys - ys[hit_ids])
+        order = np.lexsort((distances, hit_ids))
+        nearest = order[np.r_[True, hit_ids[order][1:] != hit_ids[order][:-1]]]
+
+        return hit_ids[nearest], hit_xs[nearest], hit_ys[nearest]
+
+    def __find_eating_cats(self, xs, ys):
+        """Find cats which smell food and the food they are eating.
+
+        Food is put into a grid with cells of the smell radius size, so distances
+        are computed only for cats from the 3x3 cells around some food.
+        """
+        cell_size = max(self.__FOOD_SMELL_RADIUS, 1)
+        x_cells = int(self.__BORDER["x"] // cell_size) + 1
+        y_cells = int(self.__BORDER["y"] // cell_size) + 1
+
+        food_xs, food_ys = self.__food_coordinates
+        food_x_cells = np.clip(food_xs // cell_size, 0, x_cells - 1).astype(int)
+        food_y_cells = np.clip(food_ys // cell_size, 0, y_cells - 1).astype(int)
+
+        # mark cells which have food in their neighbourhood
+        near_food = np.zeros((x_cells, y_cells), dtype=bool)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                near_food[
+                    np.clip(food_x_cells + dx, 0, x_cells - 1),
+                    np.clip(food_y_cells + dy, 0, y_cells - 1),
+                ] = True
+
+        cat_x_cells = np.clip(xs // cell_size, 0, x_cells - 1).astype(int)
+        cat_y_cells = np.clip(ys // cell_size, 0, y_cells - 1).astype(int)
+        candidate_ids = np.flatnonzero(near_food[cat_x_cells, cat_y_cells])
+
+        # food sorted by cells: food of a cell is a range in food_order
+        food_cells = food_x_cells * y_cells + food_y_cells
+        food_order = np.argsort(food_cells)
+        food_per_cell = np.bincount(food_cells, minlength=x_cells * y_cells)
+        cell_begins = np.cumsum(food_per_cell) - food_per_cell
+
+        cat_ids, food_ids = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                x_neighbours = cat_x_cells[candidate_ids] + dx
+                y_neighbours = cat_y_cells[candidate_ids] + dy
+                # skip neighbours outside of the map
+                inside = (x_neighbours >= 0) & (x_neighbours < x_cells)
+                inside &= (y_neighbours >= 0) & (y_neighbours < y_cells)
+                cells = np.where(inside, x_neighbours * y_cells + y_neighbours, 0)
+
+                begins = cell_begins[cells]
+                counts = np.where(inside, food_per_cell[cells], 0)
+
+                cat_ids.append(np.repeat(candidate_ids, counts))
+                food_ids.append(food_order[expand_ranges(begins, counts)])
+
+        cat_ids, food_ids = np.concatenate(cat_ids), np.concatenate(food_ids)
+        distances = np.hypot(
+            xs[cat_ids] - food_xs[food_ids], ys[cat_ids] - food_ys[food_ids]
+        )
+        eating = distances < self.__FOOD_SMELL_RADIUS
+
+        return np.unique(cat_ids[eating]), np.unique(food_ids[eating])
+
     def __offset_points(
         self, xs, ys, intersection_xs, intersection_ys, offset_factor=0.01
     ):
@@ -247,3 +413,415 @@ class CatGenerator(AbstractCatGenerator):
         y = ys[ids] + t[ids] * trajectories[1][ids]
 
         return (ids, x, y)
+
+
+@ti.data_oriented
+class TaichiCatGenerator(AbstractCatGenerator):
+    """Cat generator which moves cats with Taichi kernels.
+
+    Cats, their directions and states live in persistent fields, so a frame
+    doesn't allocate temporary arrays. Fields are created by start() (or the
+    first update_cats() call), so the generator can be built before ti.init()
+    and sent to another process (e.g. the CatProcessor generator worker).
+    """
+
+    HIT, EAT, SLEEP = 1, 2, 4  # bits of the cat flags
+    uses_taichi = True
+
+    def __init__(self, N, R, x_border, y_border, seed=None, food_count=10):
+        assert R < x_border and R < y_border
+
+        self.__CATS_COUNT = N
+        self.R = R
+        self.x_border = x_border
+        self.y_border = y_border
+        self.food_count = food_count
+        self.food_smell_radius = R
+
+        # grids of walls and food, see build_walls_grid() and __food_grid()
+        self.wall_cell_size = max(R, 1)
+        self.wall_x_cells = int(x_border // self.wall_cell_size) + 1
+        self.wall_y_cells = int(y_border // self.wall_cell_size) + 1
+        self.food_cell_size = max(self.food_smell_radius, 1)
+        self.food_x_cells = int(x_border // self.food_cell_size) + 1
+        self.food_y_cells = int(y_border // self.food_cell_size) + 1
+
+        self.__bad_border_coordinates = []
+        self.__walls_grid = None
+
+        self.positions = None  # fields are allocated by start()
+        self.reseed(seed)
+
+    @property
+    def N(self):
+        return self.__CATS_COUNT
+
+    @property
+    def cats(self):
+        if self.positions is None:
+            return self.__cat_coordinates
+        return self.positions.to_numpy()
+
+    @property
+    def hit_cat_ids(self):
+        return self.__hit_cat_ids
+
+    @property
+    def sleepy_cat_ids(self):
+        return self.__sleepy_cat_ids
+
+    @property
+    def eating_cat_ids(self):
+        return self.__eating_cat_ids
+
+    @property
+    def food(self):
+        return self.__food_coordinates
+
+    def start(self):
+        """Allocate fields, Taichi must be initialized."""
+        # fields live in an own SNode tree, so destroy() can free them
+        fields = ti.FieldsBuilder()
+        self.positions = ti.field(ti.f32)
+        self.directions = ti.field(ti.f32)
+        self.flags = ti.field(ti.u8)
+        self.food_positions = ti.field(ti.f32)
+        self.food_eaten = ti.field(ti.i32)
+        fields.dense(ti.ij, (2, self.N)).place(self.positions)
+        fields.dense(ti.ij, (2, self.N)).place(self.directions)
+        fields.dense(ti.i, self.N).place(self.flags)
+        fields.dense(ti.ij, (2, self.food_count)).place(self.food_positions)
+        fields.dense(ti.i, self.food_count).place(self.food_eaten)
+        self.__snode_tree = fields.finalize()
+        self.__upload()
+
+    def destroy(self):
+        """Free the fields of start(), the generator can be started again."""
+        self.__snode_tree.destroy()
+        self.positions = None
+
+    def update_cats(self):
+        """Update every cat position"""
+        if self.positions is None:
+            self.start()
+        if self.__walls_grid is None:
+            self.__build_walls_grid()
+
+        turning_cats = self.__rng.integers(0, self.N, endpoint=True)
+        sleepy_cats = self.__rng.integers(0, self.N // 10, endpoint=True)
+        seed = self.__rng.integers(0, 2**32)
+
+        walls = self.__walls_grid
+        self.__move_cats(
+            seed,
+            turning_cats / max(self.N, 1),
+            sleepy_cats / max(self.N, 1),
+            walls["walls"],
+            walls["wall_ids"],
+            walls["walls_per_cell"],
+            walls["cell_begins"],
+            *self.__food_grid(),
+        )
+
+        # relocate eaten food
+        eaten_food_ids = np.flatnonzero(self.food_eaten.to_numpy())
+        if eaten_food_ids.size:
+            self.__food_coordinates[0, eaten_food_ids] = self.__rng.integers(
+                0, self.x_border, size=eaten_food_ids.size, endpoint=True
+            )
+            self.__food_coordinates[1, eaten_food_ids] = self.__rng.integers(
+                0, self.y_border, size=eaten_food_ids.size, endpoint=True
+            )
+            self.food_positions.from_numpy(self.__food_coordinates)
+
+        flags = self.flags.to_numpy()
+        self.__hit_cat_ids = np.flatnonzero(flags & self.HIT)
+        self.__eating_cat_ids = np.flatnonzero(flags & self.EAT)
+        self.__sleepy_cat_ids = np.flatnonzero(flags & self.SLEEP)
+
+    def add_bad_border(self, a: Tuple[int, int], b: Tuple[int, int]):
+        self.__bad_border_coordinates.append([*a, *b])
+        self.__walls_grid = None
+
+    def reseed(self, seed):
+        """Place cats and food anew using random numbers from the seed."""
+        self.__rng = np.random.default_rng(seed)
+
+        self.__cat_coordinates = np.vstack(
+            (
+                self.__rng.uniform(0, self.x_border, size=self.N),
+                self.__rng.uniform(0, self.y_border, size=self.N),
+            )
+        ).astype(np.float32)
+        self.__food_coordinates = np.vstack(
+            (
+                self.__rng.uniform(0, self.x_border, size=self.food_count),
+                self.__rng.uniform(0, self.y_border, size=self.food_count),
+            )
+        ).astype(np.float32)
+        angles = self.__rng.uniform(0, 6.28, size=self.N)
+        self.__directions = np.vstack((np.cos(angles), np.sin(angles))).astype(
+            np.float32
+        )
+
+        self.__hit_cat_ids = np.array([], dtype=int)
+        self.__sleepy_cat_ids = np.array([], dtype=int)
+        self.__eating_cat_ids = np.array([], dtype=int)
+
+        if self.positions is not None:
+            self.__upload()
+
+    def __upload(self):
+        self.positions.from_numpy(self.__cat_coordinates)
+        self.directions.from_numpy(self.__directions)
+        self.food_positions.from_numpy(self.__food_coordinates)
+        self.flags.fill(0)
+
+    def __build_walls_grid(self):
+        grid = build_walls_grid(
+            self.__bad_border_coordinates,
+            self.wall_cell_size,
+            self.x_border,
+            self.y_border,
+        )
+        # kernels can't take empty arrays, cells without walls never read them
+        if not self.__bad_border_coordinates:
+            grid["walls"] = np.zeros((1, 4))
+            grid["wall_ids"] = np.zeros(1, dtype=int)
+
+        for name in ("wall_ids", "walls_per_cell", "cell_begins"):
+            grid[name] = grid[name].astype(np.int32)
+        grid["walls"] = grid["walls"].astype(np.float32)
+        self.__walls_grid = grid
+
+    def __food_grid(self):
+        """Food ids sorted by cells, number of food pieces in every cell and
+        the first position of every cell in the sorted ids."""
+        food_x_cells = (self.__food_coordinates[0] // self.food_cell_size).astype(int)
+        food_y_cells = (self.__food_coordinates[1] // self.food_cell_size).astype(int)
+        food_cells = np.clip(food_x_cells, 0, self.food_x_cells - 1) * self.food_y_cells
+        food_cells += np.clip(food_y_cells, 0, self.food_y_cells - 1)
+
+        food_per_cell = np.bincount(
+            food_cells, minlength=self.food_x_cells * self.food_y_cells
+        )
+        return (
+            np.argsort(food_cells, kind="stable").astype(np.int32),
+            food_per_cell.astype(np.int32),
+            (np.cumsum(food_per_cell) - food_per_cell).astype(np.int32),
+        )
+
+    @ti.func
+    def random(self, seed, stream, i):
+        """Uniform [0, 1) number defined only by the frame seed, stream and cat."""
+        h = pcg_hash(ti.u32(i))
+        h = pcg_hash(h ^ ti.u32(stream))
+        h = pcg_hash(h ^ seed)
+        return hash_uniform(h)
+
+    @ti.func
+    def cell_index(self, value, cell_size, cells):
+        return ti.math.clamp(ti.cast(value / cell_size, ti.i32), 0, cells - 1)
+
+    @ti.func
+    def nearest_wall_hit(
+        self,
+        x,
+        y,
+        new_x,
+        new_y,
+        walls: ti.template(),
+        wall_ids: ti.template(),
+        walls_per_cell: ti.template(),
+        cell_begins: ti.template(),
+    ):
+        """Return (t, x, y) of the nearest wall crossing of the trajectory,
+        t > 1 means that the cat doesn't hit any wall."""
+        x_from = self.cell_index(x, self.wall_cell_size, self.wall_x_cells)
+        x_to = self.cell_index(new_x, self.wall_cell_size, self.wall_x_cells)
+        y_from = self.cell_index(y, self.wall_cell_size, self.wall_y_cells)
+        y_to = self.cell_index(new_y, self.wall_cell_size, self.wall_y_cells)
+
+        trajectory = ti.Vector([new_x - x, new_y - y])
+        nearest = ti.Vector([2.0, 0.0, 0.0])
+
+        # trajectory is not longer than a cell, so it covers at most 2x2 cells
+        for cell_x in range(ti.min(x_from, x_to), ti.max(x_from, x_to) + 1):
+            for cell_y in range(ti.min(y_from, y_to), ti.max(y_from, y_to) + 1):
+                cell = cell_x * self.wall_y_cells + cell_y
+                begin = cell_begins[cell]
+                for k in range(begin, begin + walls_per_cell[cell]):
+                    w = wall_ids[k]
+                    bad_zone = ti.Vector(
+                        [walls[w, 2] - walls[w, 0], walls[w, 3] - walls[w, 1]]
+                    )
+                    start = ti.Vector([walls[w, 0] - x, walls[w, 1] - y])
+
+                    denominator = trajectory.cross(bad_zone)
+                    if denominator != 0:
+                        t = start.cross(bad_zone) / denominator
+                        u = start.cross(trajectory) / denominator
+                        if 0 <= t <= 1 and 0 <= u <= 1 and t < nearest[0]:
+                            nearest = ti.Vector(
+                                [t, x + t * trajectory[0], y + t * trajectory[1]]
+                            )
+
+        return nearest
+
+    @ti.func
+    def smells_food(
+        self,
+        x,
+        y,
+        food_ids: ti.template(),
+        food_per_cell: ti.template(),
+        cell_begins: ti.template(),
+    ):
+        """Mark all food around the cat as eaten and return whether there was any."""
+        x_cell = self.cell_index(x, self.food_cell_size, self.food_x_cells)
+        y_cell = self.cell_index(y, self.food_cell_size, self.food_y_cells)
+
+        eating = 0
+        for cell_x in range(
+            ti.max(x_cell - 1, 0), ti.min(x_cell + 2, self.food_x_cells)
+        ):
+            for cell_y in range(
+                ti.max(y_cell - 1, 0), ti.min(y_cell + 2, self.food_y_cells)
+            ):
+                cell = cell_x * self.food_y_cells + cell_y
+                begin = cell_begins[cell]
+                for k in range(begin, begin + food_per_cell[cell]):
+                    f = food_ids[k]
+                    dx = x - self.food_positions[0, f]
+                    dy = y - self.food_positions[1, f]
+                    if ti.sqrt(dx * dx + dy * dy) < self.food_smell_radius:
+                        self.food_eaten[f] = 1
+                        eating = 1
+
+        return eating
+
+    @ti.kernel
+    def __move_cats(
+        self,
+        seed: ti.u32,
+        turn_probability: ti.f32,
+        sleep_probability: ti.f32,
+        walls: ti.types.ndarray(ndim=2),
+        wall_ids: ti.types.ndarray(ndim=1),
+        walls_per_cell: ti.types.ndarray(ndim=1),
+        wall_cell_begins: ti.types.ndarray(ndim=1),
+        food_ids: ti.types.ndarray(ndim=1),
+        food_per_cell: ti.types.ndarray(ndim=1),
+        food_cell_begins: ti.types.ndarray(ndim=1),
+    ):
+        for f in range(self.food_count):
+            self.food_eaten[f] = 0
+
+        for i in range(self.N):
+            x, y = self.positions[0, i], self.positions[1, i]
+
+            # only a certain number of cats can change direction each turn
+            if self.random(seed, 0, i) < turn_probability:
+                angle = self.random(seed, 1, i) * 6.28
+                self.directions[0, i] = ti.cos(angle)
+                self.directions[1, i] = ti.sin(angle)
+
+            new_x = x + self.R * self.directions[0, i]
+            new_y = y + self.R * self.directions[1, i]
+            flags = 0
+
+            hit = self.nearest_wall_hit(
+                x, y, new_x, new_y, walls, wall_ids, walls_per_cell, wall_cell_begins
+            )
+            if hit[0] <= 1:
+                # return back with small offset otherwise the cat gets stuck
+                new_x = x + ti.abs(hit[1] - x) * 0.01
+                new_y = y + ti.abs(hit[2] - y) * 0.01
+                flags |= self.HIT
+
+            if self.smells_food(x, y, food_ids, food_per_cell, food_cell_begins):
+                new_x, new_y = x, y
+                flags |= self.EAT
+
+            if self.random(seed, 2, i) < sleep_probability:
+                new_x, new_y = x, y
+                flags |= self.SLEEP
+
+            # keep the cat within the boundaries
+            if new_x > self.x_border:
+                new_x = 0
+            elif new_x < 0:
+                new_x = self.x_border
+            if new_y > self.y_border:
+                new_y = 0
+            elif new_y < 0:
+                new_y = self.y_border
+
+            self.positions[0, i], self.positions[1, i] = new_x, new_y
+            self.flags[i] = ti.u8(flags)
+
+
+def expand_ranges(begins, counts):
+    """Concatenate ranges [begin, begin + count) into one array of indices."""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(begins, counts) + offsets
+
+
+def build_walls_grid(bad_borders, cell_size, x_border, y_border):
+    """Put bad borders into a grid with cells not smaller than the cat step.
+
+    A wall is registered in every cell its segment passes through, so a cat
+    trajectory has to be tested only against walls from the (at most 2x2)
+    cells covered by the trajectory.
+    """
+    x_cells = int(x_border // cell_size) + 1
+    y_cells = int(y_border // cell_size) + 1
+
+    walls = np.array(bad_borders, dtype=float).reshape(-1, 4)
+    wall_cells, wall_ids = [], []
+    for wall_id, (x0, y0, x1, y1) in enumerate(walls):
+        if x0 > x1:
+            x0, y0, x1, y1 = x1, y1, x0, y0
+
+        # walk through the columns of cells and find the rows the wall covers
+        columns = np.arange(int(x0 // cell_size), int(x1 // cell_size) + 1)
+        slab_x0 = np.maximum(x0, columns * cell_size)
+        slab_x1 = np.minimum(x1, (columns + 1) * cell_size)
+        if x1 > x0:
+            slope = (y1 - y0) / (x1 - x0)
+            slab_y0 = y0 + (slab_x0 - x0) * slope
+            slab_y1 = y0 + (slab_x1 - x0) * slope
+        else:
+            slab_y0, slab_y1 = np.full(1, y0), np.full(1, y1)
+
+        rows_begin = (np.minimum(slab_y0, slab_y1) // cell_size).astype(int)
+        rows_end = (np.maximum(slab_y0, slab_y1) // cell_size).astype(int) + 1
+        rows = expand_ranges(rows_begin, rows_end - rows_begin)
+
+        cells_x = np.clip(np.repeat(columns, rows_end - rows_begin), 0, x_cells - 1)
+        cells_y = np.clip(rows, 0, y_cells - 1)
+        wall_cells.append(cells_x * y_cells + cells_y)
+        wall_ids.append(np.full(rows.size, wall_id))
+
+    wall_cells = np.concatenate(wall_cells) if wall_cells else np.array([], int)
+    wall_ids = np.concatenate(wall_ids) if wall_ids else np.array([], int)
+
+    # walls of a cell are a range in the walls order
+    order = np.argsort(wall_cells, kind="stable")
+    walls_per_cell = np.bincount(wall_cells, minlength=x_cells * y_cells)
+
+    # cells whose 2x2 block (the cell and the next ones) contains walls
+    has_walls = walls_per_cell.reshape(x_cells, y_cells) > 0
+    near_walls = has_walls.copy()
+    near_walls[:-1] |= has_walls[1:]
+    near_walls[:, :-1] |= near_walls[:, 1:]
+
+    return {
+        "cell_size": cell_size,
+        "shape": (x_cells, y_cells),
+        "walls": walls,
+        "wall_ids": wall_ids[order],
+        "walls_per_cell": walls_per_cell,
+        "near_walls": near_walls,
+        "cell_begins": np.cumsum(walls_per_cell) - walls_per_cell,
+    }
@@ -1,18 +1,19 @@
 from time import perf_counter
 import pytest
-from generator import CatGenerator
+from generator.generator import CatGenerator, TaichiCatGenerator
 import random
+import numpy as np
+import taichi as ti
 
+DATA_SETS = [
+    (500, 100, 1000, 1000),  # N, R, Borders
+    (5000, 100, 1000, 1000),
+    (50000, 300, 5000, 5000),
+    (500000, 300, 5000, 5000),
+]
 
-@pytest.fixture(
-    params=[
-        (500, 100, 1000, 1000),  # N, R, Borders
-        (5000, 100, 1000, 1000),
-        (50000, 300, 5000, 5000),
-        (500000, 300, 5000, 5000),
-    ],
-    scope="function",
-)
+
+@pytest.fixture(params=DATA_SETS, scope="function")
 def cat_generator(request):
     N, R, X_BORDER, Y_BORDER = request.param
 
@@ -25,7 +26,7 @@ def test_speed(cat_generator: CatGenerator):
     cat_generator.update_cats()
     end = perf_counter()
 
-    assert start - end <= 0.5
+    assert end - start <= 0.5
 
 
 def test_cats_count(cat_generator: CatGenerator):
@@ -87,3 +88,213 @@ def test_eating_cats_count(cat_generator: CatGenerator):
 
     # approximate number of eating cats
     assert len(cat_generator.eating_cat_ids) > 10
+
+
+def test_seed_reproducibility():
+    """Check that generators with the same seed produce the same frames."""
+    generators = [CatGenerator(N=5000, R=100, x_border=1000, y_border=1000, seed=42)]
+    generators.append(
+        CatGenerator(N=5000, R=100, x_border=1000, y_border=1000, seed=42)
+    )
+    for generator in generators:
+        generator.add_bad_border((100, 100), (900, 900))
+
+    for _ in range(10):
+        for generator in generators:
+            generator.update_cats()
+
+        first, second = generators
+        assert (first.cats == second.cats).all()
+        assert (first.food == second.food).all()
+        assert (first.hit_cat_ids == second.hit_cat_ids).all()
+        assert (first.sleepy_cat_ids == second.sleepy_cat_ids).all()
+
+
+def test_eating_cats_match_brute_force(cat_generator: CatGenerator):
+    """Check that exactly the cats near food are eating."""
+    cats = cat_generator.cats.copy()
+    food = cat_generator.food.copy()
+
+    cat_generator.update_cats()
+
+    distances = np.hypot(
+        cats[0][:, None] - food[0][None, :], cats[1][:, None] - food[1][None, :]
+    )
+    radius = cat_generator._CatGenerator__FOOD_SMELL_RADIUS
+    expected = np.flatnonzero((distances < radius).any(axis=1))
+
+    assert np.array_equal(cat_generator.eating_cat_ids, expected)
+
+
+def test_lots_of_food_time_limitations():
+    """Check performance of a map with thousands of food pieces."""
+    cat_generator = CatGenerator(
+        N=500_000, R=5, x_border=1500, y_border=1000, food_count=5000
+    )
+    cat_generator.update_cats()
+
+    start = perf_counter()
+    cat_generator.update_cats()
+    end = perf_counter()
+
+    assert len(cat_generator.food[0]) == 5000
+    assert len(cat_generator.eating_cat_ids) > 0
+    assert end - start <= 0.5
+
+
+def test_wall_hits_match_brute_force():
+    """Check that the walls grid finds the same hits as testing every wall."""
+    cat_generator = CatGenerator(N=50_000, R=20, x_border=1000, y_border=1000)
+    for _ in range(100):
+        x, y = random.randint(0, 1000), random.randint(0, 1000)
+        cat_generator.add_bad_border(
+            (x, y), (x + random.randint(-100, 100), y + random.randint(-100, 100))
+        )
+    cat_generator.add_bad_border((500, 0), (500, 1000))  # vertical wall
+
+    xs, ys = np.random.uniform(0, 1000, size=(2, cat_generator.N))
+    angles = np.random.uniform(0, 2 * np.pi, size=cat_generator.N)
+    new_xs, new_ys = xs + 20 * np.cos(angles), ys + 20 * np.sin(angles)
+
+    hit_ids, hit_xs, hit_ys = cat_generator._CatGenerator__find_wall_hits(
+        xs, ys, new_xs, new_ys
+    )
+
+    expected = set()
+    for wall in cat_generator._CatGenerator__bad_border_coordinates:
+        ids, _, _ = cat_generator._CatGenerator__find_intersections(
+            xs, ys, new_xs, new_ys, *wall
+        )
+        expected.update(ids.tolist())
+
+    assert set(hit_ids.tolist()) == expected
+    assert len(expected) > 0
+
+
+@pytest.mark.parametrize("walls_count", [10, 100, 1000])
+def test_walls_count_time_limitations(walls_count):
+    """Check performance of maps with lots of short user-drawn walls."""
+    cat_generator = CatGenerator(N=500_000, R=5, x_border=1500, y_border=1000)
+    for _ in range(walls_count):
+        x, y = random.randint(0, 1500), random.randint(0, 1000)
+        cat_generator.add_bad_border(
+            (x, y), (x + random.randint(-50, 50), y + random.randint(-50, 50))
+        )
+    cat_generator.update_cats()
+
+    start = perf_counter()
+    cat_generator.update_cats()
+    end = perf_counter()
+
+    print(f"\n{walls_count} walls: {end - start:.3f}s")
+    assert len(cat_generator.hit_cat_ids) > 0
+    assert end - start <= 0.5
+
+
+@pytest.fixture(params=DATA_SETS, scope="function")
+def taichi_cat_generator(request):
+    N, R, X_BORDER, Y_BORDER = request.param
+    ti.init(arch=ti.gpu)
+
+    return TaichiCatGenerator(N=N, R=R, x_border=X_BORDER, y_border=Y_BORDER)
+
+
+def test_taichi_speed(taichi_cat_generator: TaichiCatGenerator):
+    """Compare the Taichi generator with the NumPy one on a map with walls."""
+    generators = [
+        taichi_cat_generator,
+        CatGenerator(
+            N=taichi_cat_generator.N,
+            R=taichi_cat_generator.R,
+            x_border=taichi_cat_generator.x_border,
+            y_border=taichi_cat_generator.y_border,
+        ),
+    ]
+    for _ in range(10):
+        a = (random.randint(0, 1000), random.randint(0, 1000))
+        b = (random.randint(0, 1000), random.randint(0, 1000))
+        for generator in generators:
+            generator.add_bad_border(a, b)
+
+    times = []
+    for generator in generators:
+        generator.update_cats()  # compile kernels
+
+        start = perf_counter()
+        generator.update_cats()
+        times.append(perf_counter() - start)
+
+    print(
+        f"\nN={taichi_cat_generator.N}: taichi {times[0]:.3f}s, numpy {times[1]:.3f}s"
+    )
+    assert times[0] <= 0.5
+
+
+def test_taichi_cats_stay_on_map(taichi_cat_generator: TaichiCatGenerator):
+    """Check that cats don't disappear or leave the map."""
+    for _ in range(10):
+        taichi_cat_generator.update_cats()
+
+        cats = taichi_cat_generator.cats
+        assert cats.shape == (2, taichi_cat_generator.N)
+        assert (cats >= 0).all()
+        assert (cats[0] <= taichi_cat_generator.x_border).all()
+        assert (cats[1] <= taichi_cat_generator.y_border).all()
+        assert taichi_cat_generator.food.shape == (2, 10)
+
+
+def test_taichi_eating_cats_match_brute_force(
+    taichi_cat_generator: TaichiCatGenerator,
+):
+    """Check that exactly the cats near food are eating and stay in place."""
+    taichi_cat_generator.update_cats()
+    cats = taichi_cat_generator.cats
+    food = taichi_cat_generator.food.copy()
+
+    taichi_cat_generator.update_cats()
+
+    distances = np.hypot(
+        cats[0][:, None] - food[0][None, :], cats[1][:, None] - food[1][None, :]
+    )
+    expected = np.flatnonzero(
+        (distances < taichi_cat_generator.food_smell_radius).any(axis=1)
+    )
+    eating = taichi_cat_generator.eating_cat_ids
+
+    assert np.array_equal(eating, expected)
+    assert (taichi_cat_generator.cats[:, eating] == cats[:, eating]).all()
+
+
+def test_taichi_random_bad_borders(taichi_cat_generator: TaichiCatGenerator):
+    """Check that cats can hit walls."""
+    for _ in range(10):
+        taichi_cat_generator.add_bad_border(
+            (random.randint(0, 1000), random.randint(0, 1000)),
+            (random.randint(0, 1000), random.randint(0, 1000)),
+        )
+
+    taichi_cat_generator.update_cats()
+
+    # approximate number of hit cats
+    assert len(taichi_cat_generator.hit_cat_ids) > 10
+
+
+def test_taichi_seed_reproducibility():
+    """Check that Taichi generators with the same seed produce the same frames."""
+    ti.init(arch=ti.gpu)
+    generators = [
+        TaichiCatGenerator(N=5000, R=100, x_border=1000, y_border=1000, seed=42)
+        for _ in range(2)
+    ]
+    for generator in generators:
+        generator.add_bad_border((100, 100), (900, 900))
+
+    for _ in range(10):
+        for generator in generators:
+            generator.update_cats()
+
+        first, second = generators
+        assert (first.cats == second.cats).all()
+        assert (first.food == second.food).all()
+        assert (first.hit_cat_ids == second.hit_cat_ids).all()
+        assert (first.sleepy_cat_ids == second.sleepy_cat_ids).all()
@@ -1,10 +1,20 @@
 """Cats App Entry Point"""
 
+import argparse
+
 from ui.ui import run_ui
 
 
 def main():
-    run_ui()
+    parser = argparse.ArgumentParser(description="Cats App")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--record", metavar="PATH", help="record frames to the file")
+    source.add_argument(
+        "--replay", metavar="PATH", help="play frames back from the recording"
+    )
+    args = parser.parse_args()
+
+    run_ui(record_path=args.record, replay_path=args.replay)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+"""Stage Timing Counters for Cats App"""
+
+import multiprocessing as mp
+
+
+class ProcessorMetrics:
+    """
+    Low-overhead timing counters of the processing stages.
+
+    Counters live in a shared array with one row per process (or thread),
+    every row is written only by its owner, so no locks are needed.
+
+    Stages:
+        generate: Generator update and copying of cat positions.
+        state_fill: Forming of the states array from the generator.
+        enqueue_wait: Waiting for a free slot or a place in a full queue.
+        dequeue: Waiting for a frame from the previous stage and unpacking it.
+        kernel: Algorithm get_states() call.
+        reorder_wait: Waiting in `data` for the next frame in order.
+        throttle: Waiting of the generator for the consumer to catch up
+            (see CatProcessor lookahead).
+    """
+
+    STAGES = (
+        "generate",
+        "state_fill",
+        "enqueue_wait",
+        "dequeue",
+        "kernel",
+        "reorder_wait",
+        "throttle",
+    )
+    # counters of every stage: calls, total seconds, seconds of the last call
+    __FIELDS = 3
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.__stage_ids = {stage: i for i, stage in enumerate(self.STAGES)}
+        self.__counters = mp.RawArray("d", rows * len(self.STAGES) * self.__FIELDS)
+
+    def add(self, row: int, stage: str, seconds: float):
+        """Account a call of the stage which took `seconds` in the row."""
+        i = (row * len(self.STAGES) + self.__stage_ids[stage]) * self.__FIELDS
+        self.__counters[i] += 1
+        self.__counters[i + 1] += seconds
+        self.__counters[i + 2] = seconds
+
+    def reset(self):
+        """Zero all counters, only while no other process writes them."""
+        for i in range(len(self.__counters)):
+            self.__counters[i] = 0
+
+    def reset_row(self, row: int):
+        """Zero counters of the row, called by the owner of the row."""
+        row_size = len(self.STAGES) * self.__FIELDS
+        for i in range(row * row_size, (row + 1) * row_size):
+            self.__counters[i] = 0
+
+    def summary(self):
+        """Return {stage: {"count", "mean_ms", "last_ms"}} summed over all rows."""
+        summary = {}
+        for stage, stage_id in self.__stage_ids.items():
+            count, total, last = 0, 0.0, 0.0
+            for row in range(self.rows):
+                i = (row * len(self.STAGES) + stage_id) * self.__FIELDS
+                count += int(self.__counters[i])
+                total += self.__counters[i + 1]
+                last = max(last, self.__counters[i + 2])
+
+            summary[stage] = {
+                "count": count,
+                "mean_ms": total / count * 1000 if count else 0.0,
+                "last_ms": last * 1000,
+            }
+        return summary
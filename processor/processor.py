@@ -1,6 +1,11 @@
 """Generator Module for Cats App"""
 
+import math
 import multiprocessing as mp
+import os
+import queue
+import threading
+from collections import deque
 from dataclasses import dataclass
 from time import perf_counter
 
@@ -8,8 +13,13 @@ import numpy as np
 import taichi as ti
 from numpy.typing import NDArray
 
-from algorithm.algorithm import AbstractAlgo, BasicState
+from algorithm.algorithm import AbstractAlgo, BasicState, init_taichi
 from generator.generator import AbstractCatGenerator
+from processor.metrics import ProcessorMetrics
+from processor.transport import SharedFrameRing
+
+POLL_INTERVAL = 0.05  # sec, blocked workers check for stop this often
+STOP_TIMEOUT = 2.0  # sec to finish the current frame before a worker is killed
 
 
 class CatState(BasicState):
@@ -27,44 +37,241 @@ class CatData:
 
     Attributes:
         coords (NDArray): Numpy array of cat coordinates.
-        states (NDArray): Numpy array of cat states (ints corresponding to CatState enum).
+        states (NDArray): Numpy array of cat states (ints corresponding to CatState enum),
+            None in delta frames.
+        changed_ids (NDArray): Delta frames with few changes, ids of cats whose
+            state changed since the previous frame.
+        changed_mask (NDArray): Delta frames with many changes, the same cats as
+            a bit mask packed with np.packbits.
+        changed_states (NDArray): Delta frames only, new states of these cats.
 
     Methods:
         unpack(): Returns the coordinates and states as separate arrays.
+        apply(states): Brings states of the previous frame up to this frame.
     """
 
     coords: NDArray
-    states: NDArray
+    states: NDArray | None
     food: NDArray
+    changed_ids: NDArray | None = None
+    changed_mask: NDArray | None = None
+    changed_states: NDArray | None = None
+
+    @property
+    def is_keyframe(self):
+        """Whether the frame carries states of all cats."""
+        return self.states is not None
+
+    @property
+    def changed(self):
+        """Index (ids or a boolean mask) of cats whose state changed, None in keyframes."""
+        if self.changed_mask is not None:
+            N = self.coords.shape[1]
+            return np.unpackbits(self.changed_mask, count=N).view(bool)
+        return self.changed_ids
 
     def unpack(self):
         """Unpacks the CatData into separate coordinate, state and food arrays."""
         return self.coords, self.states, self.food
 
+    def apply(self, states: NDArray) -> NDArray:
+        """Update `states` of the previous frame in place to this frame and return them."""
+        if self.is_keyframe:
+            states[:] = self.states
+        else:
+            states[self.changed] = self.changed_states
+        return states
+
+
+class StateDeltaEncoder:
+    """
+    Turns states of consecutive frames into deltas: cats whose state changed
+    (ids or, when many cats changed, a bit mask) and their new states.
+    The first frame and every `keyframe_interval`-th one are keyframes, which
+    are sent whole, as well as frames whose delta isn't smaller than the states.
+    """
+
+    def __init__(self, keyframe_interval: int):
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+
+    def reset(self):
+        """Make the next frame a keyframe (e.g. the consumer dropped previous ones)."""
+        self.__last_states = None
+        self.__frames = 0
+
+    def encode(self, states: NDArray) -> dict | None:
+        """Return the delta as CatData fields or None if the frame is a keyframe."""
+        keyframe = self.__frames % self.keyframe_interval == 0
+        self.__frames += 1
+        if self.__last_states is None or keyframe:
+            self.__last_states = states.copy()
+            return None
+
+        changed = states != self.__last_states
+        changed_states = states[changed]
+        self.__last_states[changed] = changed_states
+
+        ids_size = len(changed_states) * np.dtype(np.int32).itemsize
+        mask_size = (len(states) + 7) // 8
+        if min(ids_size, mask_size) + changed_states.nbytes >= states.nbytes:
+            return None
+        if ids_size <= mask_size:
+            changed_ids = np.flatnonzero(changed).astype(np.int32)
+            return {"changed_ids": changed_ids, "changed_states": changed_states}
+        return {"changed_mask": np.packbits(changed), "changed_states": changed_states}
+
+
+def fill_frame(
+    gen: AbstractCatGenerator,
+    cats,
+    states,
+    food,
+    metrics: ProcessorMetrics | None = None,
+    row: int = 0,
+):
+    """Write current cat positions and food into arrays and update generator."""
+    start = perf_counter()
+
+    # get new cat positions
+    cats[:] = gen.cats
+    food[:] = gen.food
+
+    # update data for next iteration
+    gen.update_cats()
+    generated = perf_counter()
+
+    # form states array
+    states.fill(CatState.WALK)
+
+    if gen.eating_cat_ids.size > 0:
+        states[gen.eating_cat_ids] = CatState.EAT
+    if gen.sleepy_cat_ids.size > 0:
+        states[gen.sleepy_cat_ids] = CatState.SLEEP
+    if gen.hit_cat_ids.size > 0:
+        states[gen.hit_cat_ids] = CatState.HIT
+
+    if metrics is not None:
+        metrics.add(row, "generate", generated - start)
+        metrics.add(row, "state_fill", perf_counter() - generated)
+
+
+def receive_config(control: mp.Queue, epoch: int, config, min_epoch: int = 0):
+    """
+    Apply control messages (epoch, new config or None to keep the current one,
+    parameters for config.configure() or None) and return the latest (epoch, config).
+
+    Waits for messages until the epoch reaches `min_epoch`.
+    """
+    while True:
+        try:
+            epoch, new_config, params = control.get(block=epoch < min_epoch)
+        except queue.Empty:
+            return epoch, config
+
+        if new_config is not None:
+            config = new_config
+        if params:
+            config.configure(**params)
+
 
 class CatProcessor:
     """
     Manages the parallel processing of cat data.
 
     Use multiprocessing to separate the generation of cat data from its processing by an algorithm.
+
+    With `use_shared_memory` frames are written into a ring of shared memory slots
+    (see SharedFrameRing) and only slot indices are sent through the queues.
+
+    `algo_workers` algorithm processes consume frames concurrently, `data`
+    reorders their results back into the generation order.
+
+    With `seed` the generator and the algorithm are reseeded on every start,
+    so runs can be reproduced.
+
+    `metrics` reports timings of every processing stage (see ProcessorMetrics).
+
+    Frames are made of `coords_dtype` coordinates and `states_dtype` states,
+    compact np.uint16 (maps up to 65535 px) or np.float32 coordinates and
+    np.uint8 states shrink every frame 4-8 times compared to the default int.
+
+    The generator runs at most `lookahead` frames ahead of `data` calls. The
+    lookahead adapts to the measured rate of `data` calls and the cost of
+    producing a frame (between `min_lookahead` and `max_size`), `pause`
+    stops producing frames until `resume`.
+
+    Workers live from `start` to `stop`: `reconfigure` sends them a new
+    algorithm or generator through control queues, so no processes are
+    spawned and Taichi isn't initialized again. Parameters like the distance
+    function or radii are changed in the running algorithm instead (see
+    AbstractAlgo.configure), without compiling its kernels again. Frames are
+    tagged with the configuration epoch and frames of previous
+    configurations are dropped.
+
+    With `warm_up` algorithm workers compile kernels for all variants (see
+    CatAlgorithm.warm_up) before the first frame, reconfigured algorithms
+    compile only the variant they use. Compiled kernels are kept in
+    the Taichi offline cache between runs.
+
+    With `delta_states` the algorithm worker sends only the cats whose state
+    changed since the previous frame (see StateDeltaEncoder), every
+    `keyframe_interval`-th frame and the first frame of a configuration
+    carry all states. Consumers keep the states and update them with
+    CatData.apply. Deltas need frames in order, so one algorithm worker.
+
+    Workers are forked, they can't inherit a Taichi runtime: don't call
+    `start` while Taichi is initialized in the calling process (call
+    ti.reset() and gc.collect() before).
     """
 
+    # rows of the metrics counters, algo workers take the rows after them
+    __CONSUMER_ROW, __GEN_ROW = 0, 1
+
     def __init__(
         self,
         algorithm: AbstractAlgo,
         generator: AbstractCatGenerator,
         max_size: int = 10,
+        use_shared_memory: bool = False,
+        algo_workers: int = 1,
+        seed: int | None = None,
+        coords_dtype=int,
+        states_dtype=int,
+        min_lookahead: int = 2,
+        warm_up: bool = False,
+        delta_states: bool = False,
+        keyframe_interval: int = 30,
     ):
+        assert algo_workers > 0, "At least one algorithm worker is required."
+        assert 0 < min_lookahead <= max_size, "Lookahead must be in 1..max_size."
+        assert not delta_states or algo_workers == 1, (
+            "State deltas need a single algorithm worker."
+        )
+        assert keyframe_interval > 0, "Keyframe interval must be positive."
+
         self.__algo = algorithm
         self.__gen = generator
+        self.__algo_workers = algo_workers
+        self.__seed = seed
+        self.__coords_dtype = coords_dtype
+        self.__states_dtype = states_dtype
+        self.__max_size = max_size
+        self.__min_lookahead = min_lookahead
+        self.__warm_up = warm_up
+        self.__delta_states = delta_states
+        self.__keyframe_interval = keyframe_interval
+        self.__lookahead = min_lookahead
+        self.__paused = False
+
+        self.__use_shared_memory = use_shared_memory
+        self.__ring = None
+
+        self.__metrics = ProcessorMetrics(2 + algo_workers)
 
         self.__stop_event = mp.Event()
         self.__stop_event.set()
 
-        # use queues to communicate between the generator and the algorithm processes.
-        self.__gen_queue = mp.Queue(max_size)
-        self.__algo_queue = mp.Queue(max_size)
-
     @property
     def bank_size(self):
         """Return the number of items in the generator and algorithm queues."""
@@ -74,107 +281,594 @@ class CatProcessor:
 
         return (self.__gen_queue.qsize(), self.__algo_queue.qsize())
 
+    @property
+    def metrics(self):
+        """Return timings of the processing stages and sizes of the queues."""
+        assert not self.__stop_event.is_set(), (
+            "Can't get metrics when processor stopped."
+        )
+
+        return {
+            **self.__metrics.summary(),
+            "bank_size": self.bank_size,
+            "lookahead": self.lookahead,
+        }
+
+    @property
+    def lookahead(self):
+        """Return how many frames the generator may run ahead of `data` calls."""
+        return 0 if self.__paused else self.__lookahead
+
     @property
     def data(self):
         """Return current CatData."""
         assert not self.__stop_event.is_set(), "Can't get data when processor stopped."
-
-        return self.__algo_queue.get()
+        assert not self.__paused, "Can't get data when processor paused."
+        start = perf_counter()
+
+        # collect frames finished by other workers until the next one arrives
+        while self.__next_data_id not in self.__pending_results:
+            result, epoch, data_id = self.__algo_queue.get()
+            if epoch != self.__epoch:
+                self.__drop(result)
+                continue
+            self.__pending_results[data_id] = result
+
+        result = self.__pending_results.pop(self.__next_data_id)
+        self.__next_data_id += 1
+
+        received = perf_counter()
+        self.__metrics.add(self.__CONSUMER_ROW, "reorder_wait", received - start)
+
+        self.__in_flight -= 1
+        self.__update_lookahead(received)
+        self.__issue_credits()
+
+        if self.__ring is None:
+            return result
+
+        # copy the frame out so the slot can be reused by the workers
+        slot, delta = result if self.__delta_states else (result, None)
+        cats, states, food = self.__ring.frame(slot)
+        if delta is None:
+            cats_data = CatData(cats.copy(), states.copy(), food.copy())
+        else:
+            cats_data = CatData(cats.copy(), None, food.copy(), **delta)
+        self.__ring.release(slot)
+
+        self.__metrics.add(self.__CONSUMER_ROW, "dequeue", perf_counter() - received)
+        return cats_data
 
     def start(self):
         assert self.__stop_event.is_set(), "Processor already have been started."
         self.__stop_event.clear()
+        self.__reseed(self.__algo, self.__gen)
+
+        if self.__use_shared_memory:
+            # enough slots for both full queues and a frame inside every worker
+            self.__ring = SharedFrameRing(
+                self.__gen.N,
+                self.__gen.food.shape[1],
+                2 * self.__max_size + 2 + self.__algo_workers,
+                coords_dtype=self.__coords_dtype,
+                states_dtype=self.__states_dtype,
+            )
+
+        # use queues to communicate between the generator and the algorithm processes,
+        # fresh ones, so nothing is left from the previous run
+        self.__gen_queue = mp.Queue(self.__max_size)
+        self.__algo_queue = mp.Queue(self.__max_size)
+        self.__gen_control = mp.Queue()
+        self.__algo_controls = [mp.Queue() for _ in range(self.__algo_workers)]
+        self.__epoch = 0
+
+        self.__metrics.reset()
+
+        self.__paused = False
+        self.__lookahead = min(
+            max(self.__min_lookahead, self.__algo_workers + 1), self.__max_size
+        )
+        self.__last_data_time = None
+        self.__data_interval = None  # smoothed time between `data` calls
+        # every credit allows the generator to produce one frame
+        self.__credits = mp.Semaphore(0)
+        self.__in_flight = 0  # credits issued, but not returned by `data` yet
 
         self.__start_workers()
+        self.__issue_credits()
+
+    def reconfigure(
+        self,
+        algorithm: AbstractAlgo | None = None,
+        generator: AbstractCatGenerator | None = None,
+        algo_params: dict | None = None,
+    ):
+        """
+        Replace the algorithm and/or the generator in the running workers,
+        change `algo_params` (e.g. {"distance_fun": ..., "R0": ...}) of the
+        algorithm with AbstractAlgo.configure.
+
+        Frames computed for the previous configuration are dropped, the next
+        `data` returns the first frame of the new one. A kept generator goes on
+        from its current cats. With shared memory the number of cats and food
+        can't change.
+        """
+        assert not self.__stop_event.is_set(), "Can't reconfigure stopped processor."
+        if generator is not None:
+            assert self.__ring is None or (
+                generator.N == self.__ring.N
+                and generator.food.shape[1] == self.__ring.food_count
+            ), "Shared memory frames can't change their size."
+            self.__gen = generator
+        if algorithm is not None:
+            self.__algo = algorithm
+        if algo_params:
+            # checks the parameters, workers change their copies the same way
+            self.__algo.configure(**algo_params)
+        self.__reseed(algorithm, generator)
+
+        # configurations are sent before frames of the new epoch exist
+        self.__epoch += 1
+        for control in self.__algo_controls:
+            control.put((self.__epoch, algorithm, algo_params))
+        self.__gen_control.put((self.__epoch, generator, None))
+
+        for result in self.__pending_results.values():
+            self.__drop(result)
+        self.__pending_results = {}
+        self.__next_data_id = 1
+
+        # workers add to their rows all the time, so every worker zeroes
+        # its own row when it receives the new configuration
+        self.__metrics.reset_row(self.__CONSUMER_ROW)
+        self.__last_data_time = None
+        self.__data_interval = None
+
+    def pause(self):
+        """Stop producing new frames, already requested frames are finished."""
+        assert not self.__stop_event.is_set(), "Can't pause stopped processor."
+        self.__paused = True
+
+    def resume(self):
+        """Continue producing frames after pause."""
+        assert not self.__stop_event.is_set(), "Can't resume stopped processor."
+        self.__paused = False
+        self.__last_data_time = None  # the pause is not a consumer interval
+        self.__issue_credits()
 
     def stop(self):
         """Stop worker processes."""
         assert not self.__stop_event.is_set(), "Processor already have been stopped."
         self.__stop_event.set()
 
-        self.__gen_proc.kill()
-        self.__gen_proc.join()
+        # workers finish their current frame and exit by themselves
+        for proc in [self.__gen_proc, *self.__algo_processes]:
+            proc.join(STOP_TIMEOUT)
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
 
-        self.__algo_proc.kill()
-        self.__algo_proc.join()
+        if self.__ring is not None:
+            self.__ring.close()
+            self.__ring.unlink()
+            self.__ring = None
+
+    def __reseed(
+        self, algorithm: AbstractAlgo | None, generator: AbstractCatGenerator | None
+    ):
+        if self.__seed is None:
+            return
+
+        # independent streams for the generator and the algorithm
+        gen_seed, algo_seed = np.random.SeedSequence(self.__seed).generate_state(2)
+        if generator is not None:
+            generator.reseed(gen_seed)
+        if algorithm is not None:
+            algorithm.reseed(algo_seed)
+
+    def __drop(self, result):
+        """Forget a frame of a previous configuration."""
+        if self.__ring is not None:
+            self.__ring.release(result[0] if self.__delta_states else result)
+        self.__in_flight -= 1
+        self.__issue_credits()
+
+    def __update_lookahead(self, now: float):
+        """Size the lookahead so frames in flight cover the production latency
+        at the rate of `data` calls (Little's law) plus one spare frame."""
+        if self.__last_data_time is not None:
+            interval = now - self.__last_data_time
+            if self.__data_interval is None:
+                self.__data_interval = interval
+            else:
+                self.__data_interval = 0.8 * self.__data_interval + 0.2 * interval
+        self.__last_data_time = now
+
+        summary = self.__metrics.summary()
+        gen_cost = (
+            summary["generate"]["mean_ms"] + summary["state_fill"]["mean_ms"]
+        ) / 1000
+        kernel_cost = summary["kernel"]["mean_ms"] / 1000
+        if self.__data_interval is None or gen_cost == 0 or kernel_cost == 0:
+            return
+
+        # frames can't be produced faster than the slowest stage allows
+        bottleneck = max(gen_cost, kernel_cost / self.__algo_workers)
+        rate = 1 / max(self.__data_interval, bottleneck)
+        lookahead = math.ceil((gen_cost + kernel_cost) * rate) + 1
+        self.__lookahead = min(max(lookahead, self.__min_lookahead), self.__max_size)
+
+    def __issue_credits(self):
+        """Let the generator run up to `lookahead` frames ahead of `data`."""
+        while self.__in_flight < self.lookahead:
+            self.__credits.release()
+            self.__in_flight += 1
 
     def __start_workers(self):
         self.__gen_proc = mp.Process(
             target=self.__gen_worker,
-            args=(self.__gen.N, self.__gen_queue, self.__gen),
+            args=(
+                self.__gen_queue,
+                self.__gen,
+                self.__ring,
+                self.__metrics,
+                self.__credits,
+                self.__gen_control,
+                self.__stop_event,
+            ),
             name="generator worker",
         )
         self.__gen_proc.start()
 
-        # variable for algo workers sync
-        self.__last_result_num = mp.Value("i", 0)
+        # reorder buffer for results of algo workers
+        self.__next_data_id = 1
+        self.__pending_results = {}
+
         self.__algo_processes: list[mp.Process] = []
 
-        # start algo workers
-        self.__algo_proc = mp.Process(
-            target=self.__algo_worker,
-            args=(
-                self.__gen_queue,
-                self.__algo_queue,
-                self.__algo,
-                self.__last_result_num,
-            ),
-            name="algorithm worker",
-        )
-        self.__algo_proc.start()
+        # split cpu threads between algo workers so they don't fight for cores
+        threads = max(1, (os.cpu_count() or 1) // self.__algo_workers)
 
-    def __gen_worker(self, N: int, q: mp.Queue, gen: AbstractCatGenerator):
-        data_num = 0  # last generated data number (need for sync)
+        # start algo workers
+        for worker_num in range(self.__algo_workers):
+            algo_proc = mp.Process(
+                target=self.__algo_worker,
+                args=(
+                    self.__gen_queue,
+                    self.__algo_queue,
+                    self.__algo,
+                    self.__ring,
+                    threads,
+                    self.__metrics,
+                    self.__GEN_ROW + 1 + worker_num,
+                    self.__algo_controls[worker_num],
+                    self.__stop_event,
+                ),
+                name=f"algorithm worker {worker_num}",
+            )
+            algo_proc.start()
+            self.__algo_processes.append(algo_proc)
+
+    def __gen_worker(
+        self,
+        q: mp.Queue,
+        gen: AbstractCatGenerator,
+        ring: SharedFrameRing | None,
+        metrics: ProcessorMetrics,
+        credits: mp.Semaphore,
+        control: mp.Queue,
+        stop_event: mp.Event,
+    ):
+        # frames left in the queue after stop are not needed
+        q.cancel_join_thread()
+
+        taichi_ready = False
+        started_gen = None
+        epoch = 0
+        data_num = 0  # last generated data number of the epoch (need for sync)
+
+        start = perf_counter()
+        while not stop_event.is_set():
+            # don't run further ahead of the consumer than the lookahead allows
+            if not credits.acquire(timeout=POLL_INTERVAL):
+                continue
+            metrics.add(self.__GEN_ROW, "throttle", perf_counter() - start)
+
+            new_epoch, gen = receive_config(control, epoch, gen)
+            if gen is not started_gen:
+                if started_gen is not None:
+                    started_gen.destroy()  # the worker lives on, free the old fields
+                if gen.uses_taichi and not taichi_ready:
+                    init_taichi()
+                    taichi_ready = True
+                gen.start()
+                started_gen = gen
+            if new_epoch != epoch:
+                epoch, data_num = new_epoch, 0
+                metrics.reset_row(self.__GEN_ROW)
 
-        while True:
             data_num += 1
+            start = perf_counter()
 
-            # get new cat positions
-            cats = gen.cats.astype(int)
-            food = gen.food.astype(int)
-
-            # form states array
-            states = np.full(N, CatState.WALK)
+            if ring is None:
+                cats = np.empty((2, gen.N), dtype=self.__coords_dtype)
+                states = np.empty(gen.N, dtype=self.__states_dtype)
+                food = np.empty(gen.food.shape, dtype=self.__coords_dtype)
+            else:
+                # write the frame directly into the shared memory
+                slot = ring.acquire()
+                cats, states, food = ring.frame(slot)
 
-            # update data for next iteration
-            gen.update_cats()
+            waited = perf_counter() - start
+            fill_frame(gen, cats, states, food, metrics, self.__GEN_ROW)
+            start = perf_counter()
 
-            if gen.eating_cat_ids.size > 0:
-                states[gen.eating_cat_ids] = CatState.EAT
-            if gen.sleepy_cat_ids.size > 0:
-                states[gen.sleepy_cat_ids] = CatState.SLEEP
-            if gen.hit_cat_ids.size > 0:
-                states[gen.hit_cat_ids] = CatState.HIT
+            # put data for algo
+            if ring is None:
+                q.put((CatData(cats, states, food), epoch, data_num))
+            else:
+                q.put((slot, epoch, data_num))
 
-            # add states array to cats array
-            cats_data = CatData(cats, states, food)
+            waited += perf_counter() - start
+            metrics.add(self.__GEN_ROW, "enqueue_wait", waited)
+            start = perf_counter()
 
-            # put data for algo
-            q.put((cats_data, data_num))
+        if taichi_ready:
+            ti.reset()  # writes compiled kernels to the offline cache
 
     def __algo_worker(
-        self, q_get: mp.Queue, q_put: mp.Queue, algo: AbstractAlgo, last_data_id
+        self,
+        q_get: mp.Queue,
+        q_put: mp.Queue,
+        algo: AbstractAlgo,
+        ring: SharedFrameRing | None,
+        threads: int,
+        metrics: ProcessorMetrics,
+        row: int,
+        control: mp.Queue,
+        stop_event: mp.Event,
     ):
-        ti.init(arch=ti.cpu)
-        algo.start()
+        q_put.cancel_join_thread()
 
-        while True:
-            gen_worker_data = q_get.get()
+        init_taichi(cpu_max_num_threads=threads)
+        algo.start()
+        if self.__warm_up:
+            algo.warm_up(self.__coords_dtype, self.__states_dtype)
+        epoch = 0
+
+        encoder = None
+        if self.__delta_states:
+            encoder = StateDeltaEncoder(self.__keyframe_interval)
+            encoded_epoch = epoch
+
+        start = perf_counter()
+        while not stop_event.is_set():
+            try:
+                payload, frame_epoch, my_data_id = q_get.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            # configuration of an epoch is sent before its frames
+            new_epoch, new_algo = receive_config(control, epoch, algo, frame_epoch)
+            if new_epoch != epoch:
+                epoch = new_epoch
+                metrics.reset_row(row)
+            if new_algo is not algo:
+                algo.destroy()  # the worker lives on, free the old fields
+                # only the kernel variant in use is compiled (or loaded from the cache)
+                algo = new_algo
+                algo.start()
+
+            if frame_epoch != epoch:
+                # frame of a previous configuration, the consumer drops it
+                if ring is not None and encoder is not None:
+                    payload = (payload, None)
+                q_put.put((payload, frame_epoch, my_data_id))
+                start = perf_counter()
+                continue
 
             # unpacking
-            cats, states, food = gen_worker_data[0].unpack()
-            my_data_id: int = gen_worker_data[1]
+            if ring is None:
+                cats, states, food = payload.unpack()
+            else:
+                cats, states, food = ring.frame(payload)
+
+            dequeued = perf_counter()
 
             # replace empty states with new algo states
-            algo.get_states(cats, states)
+            algo.get_states(cats, states, frame=my_data_id)
+            computed = perf_counter()
+
+            delta = None
+            if encoder is not None:
+                if epoch != encoded_epoch:
+                    # frames of the previous configuration are dropped
+                    encoder.reset()
+                    encoded_epoch = epoch
+                delta = encoder.encode(states)
 
             # pack
-            result = CatData(cats, states, food)
+            if ring is None:
+                if delta is None:
+                    result = CatData(cats, states, food)
+                else:
+                    result = CatData(cats, None, food, **delta)
+            elif encoder is None:
+                # states were updated in place, pass the slot further
+                result = payload
+            else:
+                result = (payload, delta)
+
+            # put data for output, the order is restored by the consumer
+            q_put.put((result, epoch, my_data_id))
+
+            metrics.add(row, "dequeue", dequeued - start)
+            metrics.add(row, "kernel", computed - dequeued)
+            metrics.add(row, "enqueue_wait", perf_counter() - computed)
+            start = perf_counter()
+
+        ti.reset()  # writes compiled kernels to the offline cache
+
 
-            # wait until worker can put data
-            while last_data_id.value != my_data_id - 1:
-                pass
+class FusedCatProcessor:
+    """
+    Runs the generator and the algorithm in the calling process.
+
+    Frames go from the generator to the algorithm through two preallocated
+    buffers, without queues, pickling or other processes. With
+    `double_buffering` a thread generates the next frame while the algorithm
+    processes the current one (not for Taichi generators: their kernels would
+    be launched from two threads at once).
+
+    Has the same interface as CatProcessor (including `metrics`), `fps`
+    reports the achieved frame rate over the last `fps_window` frames.
+
+    Taichi is initialized in the calling process, so don't start a CatProcessor
+    (which forks its workers) after it.
+
+    `coords_dtype`, `states_dtype` and `warm_up` work like in CatProcessor.
+    """
+
+    def __init__(
+        self,
+        algorithm: AbstractAlgo,
+        generator: AbstractCatGenerator,
+        double_buffering: bool = True,
+        seed: int | None = None,
+        fps_window: int = 30,
+        coords_dtype=int,
+        states_dtype=int,
+        warm_up: bool = False,
+    ):
+        self.__algo = algorithm
+        self.__gen = generator
+        self.__double_buffering = double_buffering and not generator.uses_taichi
+        self.__seed = seed
+        self.__warm_up = warm_up
+
+        self.__buffers = [
+            (
+                np.empty((2, generator.N), dtype=coords_dtype),
+                np.empty(generator.N, dtype=states_dtype),
+                np.empty(generator.food.shape, dtype=coords_dtype),
+            )
+            for _ in range(2)
+        ]
+        self.__frame_times = deque(maxlen=max(fps_window, 2))
+        self.__metrics = ProcessorMetrics(2)  # calling and generator threads
+        self.__running = False
+
+    @property
+    def bank_size(self):
+        """Return the number of generated frames waiting for the algorithm."""
+        assert self.__running, "Can't get bank size when processor stopped."
+
+        return (self.__ready_buffers.qsize(), 0)
+
+    @property
+    def metrics(self):
+        """Return timings of the processing stages and sizes of the queues."""
+        assert self.__running, "Can't get metrics when processor stopped."
+
+        return {**self.__metrics.summary(), "bank_size": self.bank_size}
+
+    @property
+    def fps(self):
+        """Return frames/sec achieved by the recent `data` calls."""
+        if len(self.__frame_times) < 2:
+            return 0.0
+
+        duration = self.__frame_times[-1] - self.__frame_times[0]
+        return (len(self.__frame_times) - 1) / duration if duration > 0 else 0.0
+
+    @property
+    def data(self):
+        """Return current CatData."""
+        assert self.__running, "Can't get data when processor stopped."
+
+        if self.__gen_thread is None:
+            buffer = 0
+            fill_frame(self.__gen, *self.__buffers[buffer], self.__metrics, 0)
+        else:
+            start = perf_counter()
+            buffer = self.__ready_buffers.get()
+            self.__metrics.add(0, "reorder_wait", perf_counter() - start)
+
+        cats, states, food = self.__buffers[buffer]
+        self.__data_num += 1
+        start = perf_counter()
+        self.__algo.get_states(cats, states, frame=self.__data_num)
+        computed = perf_counter()
+
+        # copy the frame out so the buffer can be reused by the generator
+        cats_data = CatData(cats.copy(), states.copy(), food.copy())
+        if self.__gen_thread is not None:
+            self.__free_buffers.put(buffer)
+
+        self.__metrics.add(0, "kernel", computed - start)
+        self.__metrics.add(0, "dequeue", perf_counter() - computed)
+
+        self.__frame_times.append(perf_counter())
+        return cats_data
+
+    def start(self):
+        assert not self.__running, "Processor already have been started."
+        self.__running = True
+
+        if self.__seed is not None:
+            # same streams as CatProcessor, so both produce the same frames
+            gen_seed, algo_seed = np.random.SeedSequence(self.__seed).generate_state(2)
+            self.__gen.reseed(gen_seed)
+            self.__algo.reseed(algo_seed)
+
+        init_taichi()
+        self.__gen.start()
+        self.__algo.start()
+        if self.__warm_up:
+            cats, states, _ = self.__buffers[0]
+            self.__algo.warm_up(cats.dtype, states.dtype)
+
+        self.__data_num = 0
+        self.__frame_times.clear()
+        self.__metrics.reset()
+        self.__free_buffers = queue.Queue()
+        self.__ready_buffers = queue.Queue()
+
+        self.__gen_thread = None
+        if self.__double_buffering:
+            for buffer in range(len(self.__buffers)):
+                self.__free_buffers.put(buffer)
+
+            self.__gen_thread = threading.Thread(
+                target=self.__gen_worker, name="generator worker", daemon=True
+            )
+            self.__gen_thread.start()
+
+    def pause(self):
+        """Nothing to throttle: at most one frame is generated in advance."""
+        assert self.__running, "Can't pause stopped processor."
+
+    def resume(self):
+        assert self.__running, "Can't resume stopped processor."
+
+    def stop(self):
+        """Stop the generator thread."""
+        assert self.__running, "Processor already have been stopped."
+        self.__running = False
+
+        if self.__gen_thread is not None:
+            self.__free_buffers.put(None)
+            self.__gen_thread.join()
+
+        # start() allocates the fields again
+        self.__gen.destroy()
+        self.__algo.destroy()
+
+    def __gen_worker(self):
+        while True:
+            buffer = self.__free_buffers.get()
+            if buffer is None:
+                break
 
-            # put data for output
-            q_put.put(result)
-            last_data_id.value += 1
+            fill_frame(self.__gen, *self.__buffers[buffer], self.__metrics, 1)
+            self.__ready_buffers.put(buffer)
@@ -0,0 +1,215 @@
+"""Frame Recording and Replay for Cats App"""
+
+import os
+
+import numpy as np
+
+from processor.processor import CatData
+
+MAGIC = b"CATREC"
+VERSION = 1
+HEADER_SIZE = 4096  # records start at a page boundary
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("frames", "<u8"),
+        ("N", "<u8"),
+        ("food_count", "<u8"),
+        ("coords_dtype", "S16"),
+        ("states_dtype", "S16"),
+    ]
+)
+
+
+def record_dtype(N: int, food_count: int, coords_dtype, states_dtype) -> np.dtype:
+    """Fixed-size record of one frame, every array is stored as a column."""
+    return np.dtype(
+        [
+            ("coords", coords_dtype, (2, N)),
+            ("states", states_dtype, (N,)),
+            ("food", coords_dtype, (2, food_count)),
+        ],
+        align=True,
+    )
+
+
+class FrameRecorder:
+    """
+    Streams CatData frames into a file which FrameReplay can play back.
+
+    The file starts with a header (number of frames, number of cats and food,
+    dtypes) followed by fixed-size frame records. Every record is flushed
+    to the file at once, so a crashed recording keeps all complete frames.
+
+    Methods:
+        write(cats_data): Appends a frame.
+        record(source, frames): Appends frames taken from `source.data`.
+        close(): Writes the header and closes the file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        N: int,
+        food_count: int,
+        coords_dtype=np.int32,
+        states_dtype=np.uint8,
+    ):
+        self.N = N
+        self.food_count = food_count
+        self.frames = 0
+
+        self.__header = np.zeros((), dtype=HEADER_DTYPE)
+        self.__header["magic"] = MAGIC
+        self.__header["version"] = VERSION
+        self.__header["N"] = N
+        self.__header["food_count"] = food_count
+        self.__header["coords_dtype"] = np.dtype(coords_dtype).str
+        self.__header["states_dtype"] = np.dtype(states_dtype).str
+
+        # one record is reused for all frames
+        self.__record = np.zeros(
+            (), dtype=record_dtype(N, food_count, coords_dtype, states_dtype)
+        )
+
+        # a buffered file writes all bytes of a record (a raw one may write
+        # fewer), records are flushed one by one
+        self.__file = open(path, "wb")
+        self.__write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, cats_data: CatData):
+        """Append the frame to the file, delta frames (see CatData.apply) as well."""
+        coords, _, food = cats_data.unpack()
+        assert coords.shape == (2, self.N) and food.shape == (2, self.food_count), (
+            "Frame doesn't match the recording size."
+        )
+        assert self.frames > 0 or cats_data.is_keyframe, (
+            "Recording must start with a keyframe."
+        )
+
+        self.__record["coords"] = coords
+        # the record keeps states of the previous frame
+        cats_data.apply(self.__record["states"])
+        self.__record["food"] = food
+        self.__file.write(self.__record.tobytes())
+        self.__file.flush()
+        self.frames += 1
+
+    def record(self, source, frames: int):
+        """Append `frames` frames taken from the source (e.g. CatProcessor)."""
+        for _ in range(frames):
+            self.write(source.data)
+
+    def close(self):
+        """Write the final number of frames into the header and close the file."""
+        if self.__file.closed:
+            return
+
+        self.__write_header()
+        self.__file.close()
+
+    def __write_header(self):
+        self.__header["frames"] = self.frames
+        self.__file.seek(0)
+        self.__file.write(self.__header.tobytes().ljust(HEADER_SIZE, b"\0"))
+        self.__file.seek(0, 2)
+
+
+class FrameReplay:
+    """
+    Plays a recording made by FrameRecorder back with the CatProcessor interface.
+
+    Frames are memory-mapped: `data` returns CatData views into the file
+    without reading or copying the whole frame. With `loop` the replay starts
+    over after the last frame.
+
+    The number of frames is taken from the file size, so recordings which
+    weren't closed (e.g. the app crashed) are played up to the last complete
+    frame.
+    """
+
+    def __init__(self, path: str, loop: bool = True):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if header.size == 0 or header[0]["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a cats recording.")
+        header = header[0]
+        if header["version"] != VERSION:
+            raise ValueError(f"Unsupported recording version {header['version']}.")
+
+        self.N = int(header["N"])
+        self.food_count = int(header["food_count"])
+        self.__loop = loop
+
+        dtype = record_dtype(
+            self.N,
+            self.food_count,
+            header["coords_dtype"].decode(),
+            header["states_dtype"].decode(),
+        )
+        # the header gets the number of frames only on close
+        self.frames = max(os.path.getsize(path) - HEADER_SIZE, 0) // dtype.itemsize
+        self.__records = None  # empty files can't be mapped
+        if self.frames > 0:
+            self.__records = np.memmap(
+                path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(self.frames,)
+            )
+        self.__running = False
+
+    @property
+    def bank_size(self):
+        """Return the number of frames left till the end of the recording."""
+        assert self.__running, "Can't get bank size when replay stopped."
+
+        return (self.frames - self.__next_frame, 0)
+
+    @property
+    def metrics(self):
+        """Return the same metrics as CatProcessor (only sizes of the queues)."""
+        assert self.__running, "Can't get metrics when replay stopped."
+
+        return {"bank_size": self.bank_size}
+
+    @property
+    def data(self):
+        """Return the next recorded CatData."""
+        assert self.__running, "Can't get data when replay stopped."
+
+        if self.__next_frame == self.frames:
+            if not self.__loop or self.frames == 0:
+                raise EOFError("No more frames in the recording.")
+            self.__next_frame = 0
+
+        cats_data = self.frame(self.__next_frame)
+        self.__next_frame += 1
+        return cats_data
+
+    def frame(self, i: int) -> CatData:
+        """Return the i-th recorded frame (no copy)."""
+        return CatData(
+            self.__records["coords"][i],
+            self.__records["states"][i],
+            self.__records["food"][i],
+        )
+
+    def start(self):
+        assert not self.__running, "Replay already have been started."
+        self.__running = True
+        self.__next_frame = 0
+
+    def pause(self):
+        """Nothing to throttle: frames are read on demand."""
+        assert self.__running, "Can't pause stopped replay."
+
+    def resume(self):
+        assert self.__running, "Can't resume stopped replay."
+
+    def stop(self):
+        assert self.__running, "Replay already have been stopped."
+        self.__running = False
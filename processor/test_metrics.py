@@ -0,0 +1,21 @@
+from processor.metrics import ProcessorMetrics
+
+
+def test_metrics_reset():
+    metrics = ProcessorMetrics(3)
+    for row in range(3):
+        for stage in ProcessorMetrics.STAGES:
+            metrics.add(row, stage, 0.002)
+
+    summary = metrics.summary()
+    for stage in ProcessorMetrics.STAGES:
+        assert summary[stage]["count"] == 3
+        assert abs(summary[stage]["mean_ms"] - 2) < 1e-9
+
+    # a worker zeroes only its own row
+    metrics.reset_row(1)
+    assert all(s["count"] == 2 for s in metrics.summary().values())
+
+    metrics.reset()
+    for stage_summary in metrics.summary().values():
+        assert stage_summary == {"count": 0, "mean_ms": 0.0, "last_ms": 0.0}
@@ -0,0 +1,275 @@
+import gc
+import time
+import numpy as np
+import pytest
+import taichi as ti
+from algorithm.algorithm import BasicState, CatAlgorithm, DistanceFunction
+from generator.generator import CatGenerator, TaichiCatGenerator
+from processor.processor import (
+    CatData,
+    CatProcessor,
+    FusedCatProcessor,
+    StateDeltaEncoder,
+)
+from processor.metrics import ProcessorMetrics
+
+N, X, Y = 2000, 1000, 1000
+
+
+@pytest.fixture(autouse=True)
+def no_taichi_runtime():
+    # CatProcessor forks its workers, they can't inherit a Taichi runtime
+    # of the test process (e.g. of the previous tests): workers crashed
+    # collecting its leftover objects
+    ti.reset()
+    gc.collect()
+
+
+def make_processor(processor_class=CatProcessor, **kwargs):
+    # R0 < R1: states depend on random hissing too
+    algorithm = CatAlgorithm(X, Y, N, 5, 15)
+    generator = CatGenerator(N, 5, X, Y)
+    return processor_class(algorithm, generator, seed=42, **kwargs)
+
+
+def take_frames(processor, count=6):
+    processor.start()
+    try:
+        return [processor.data for _ in range(count)]
+    finally:
+        processor.stop()
+
+
+def assert_same_frames(frames, expected):
+    assert len(frames) == len(expected)
+    for cats_data, expected_data in zip(frames, expected):
+        assert np.array_equal(cats_data.coords, expected_data.coords)
+        assert np.array_equal(cats_data.states, expected_data.states)
+        assert np.array_equal(cats_data.food, expected_data.food)
+
+
+@pytest.mark.parametrize(
+    "changes, delta_field",
+    [
+        (0, "changed_ids"),
+        (5, "changed_ids"),  # few changed cats are sent as ids
+        (3000, "changed_mask"),  # many as a bit mask
+        (10_000, None),  # a delta as large as the states makes a keyframe
+    ],
+)
+def test_deltas_rebuild_states(changes, delta_field):
+    N, keyframe_interval = 10_000, 7
+    encoder = StateDeltaEncoder(keyframe_interval)
+    coords = np.zeros((2, N), dtype=np.uint16)
+    food = np.zeros((2, 4), dtype=np.uint16)
+
+    states = np.random.randint(1, 7, N).astype(np.uint8)
+    received = np.zeros(N, dtype=np.uint8)
+    for frame in range(3 * keyframe_interval):
+        states = states.copy()
+        changed = np.random.choice(N, changes, replace=False)
+        states[changed] = states[changed] % 6 + 1  # a different state
+
+        delta = encoder.encode(states)
+        keyframe = frame % keyframe_interval == 0 or delta_field is None
+        assert (delta is None) == keyframe
+        if delta is None:
+            cats_data = CatData(coords, states.copy(), food)
+        else:
+            assert delta.keys() == {delta_field, "changed_states"}
+            cats_data = CatData(coords, None, food, **delta)
+
+        assert cats_data.is_keyframe == keyframe
+        cats_data.apply(received)
+        assert np.array_equal(received, states)
+
+
+def test_delta_encoder_reset():
+    encoder = StateDeltaEncoder(keyframe_interval=100)
+    states = np.ones(1000, dtype=np.uint8)
+
+    assert encoder.encode(states) is None
+    assert encoder.encode(states) is not None
+    # e.g. the consumer dropped the previous frames
+    encoder.reset()
+    assert encoder.encode(states) is None
+    assert encoder.encode(states) is not None
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"algo_workers": 3},
+        {"use_shared_memory": True},
+        {"algo_workers": 3, "use_shared_memory": True},
+    ],
+)
+def test_processor_frames_depend_only_on_seed(kwargs):
+    expected = take_frames(make_processor())
+    # frames of several workers come back in order, random decisions
+    # depend on the frame number and not on the worker
+    assert_same_frames(take_frames(make_processor(**kwargs)), expected)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"use_shared_memory": True},
+        {"coords_dtype": np.uint16, "states_dtype": np.uint8},
+        {
+            "use_shared_memory": True,
+            "coords_dtype": np.uint16,
+            "states_dtype": np.uint8,
+        },
+    ],
+)
+def test_delta_frames_match_full_frames(kwargs):
+    expected = take_frames(make_processor(**kwargs), 10)
+    frames = take_frames(
+        make_processor(delta_states=True, keyframe_interval=4, **kwargs), 10
+    )
+
+    assert frames[0].is_keyframe
+    assert not all(cats_data.is_keyframe for cats_data in frames)
+    states = frames[0].states.copy()
+    for cats_data, expected_data in zip(frames, expected):
+        # the consumer keeps the states and brings them up to every frame
+        cats_data.apply(states)
+        assert np.array_equal(cats_data.coords, expected_data.coords)
+        assert np.array_equal(states, expected_data.states)
+        assert np.array_equal(cats_data.food, expected_data.food)
+
+
+@pytest.mark.parametrize("use_shared_memory", [False, True])
+def test_processor_restart(use_shared_memory):
+    processor = make_processor(use_shared_memory=use_shared_memory, algo_workers=2)
+    expected = take_frames(processor)
+    # start() reseeds, so the frames are produced again
+    assert_same_frames(take_frames(processor), expected)
+
+
+def test_processor_metrics_count_frames():
+    max_size = 4
+    processor = make_processor(max_size=max_size, use_shared_memory=True)
+    processor.start()
+    try:
+        for _ in range(3):
+            processor.data
+        before = processor.metrics
+        # more frames than the generator can produce ahead of the first ones
+        for _ in range(max_size + 5):
+            processor.data
+        after = processor.metrics
+    finally:
+        processor.stop()
+
+    for stage in ProcessorMetrics.STAGES:
+        assert after[stage]["count"] > before[stage]["count"] > 0, stage
+
+
+def test_pause_stops_generator():
+    max_size = 4
+    expected = take_frames(make_processor(max_size=max_size), 8)
+
+    processor = make_processor(max_size=max_size)
+    processor.start()
+    try:
+        frames = [processor.data for _ in range(4)]
+        processor.pause()
+        assert processor.lookahead == 0
+
+        # frames requested before the pause are finished, then nothing more
+        time.sleep(0.5)
+        generated = processor.metrics["generate"]["count"]
+        assert generated <= len(frames) + max_size
+        time.sleep(0.5)
+        assert processor.metrics["generate"]["count"] == generated
+
+        processor.resume()
+        assert processor.lookahead > 0
+        frames += [processor.data for _ in range(4)]
+    finally:
+        processor.stop()
+
+    # the pause doesn't skip or reorder frames
+    assert_same_frames(frames, expected)
+
+
+def test_lookahead_bounds_with_slow_consumer():
+    min_lookahead, max_size = 2, 6
+    processor = make_processor(min_lookahead=min_lookahead, max_size=max_size)
+    processor.start()
+    try:
+        for _ in range(15):
+            processor.data
+            assert min_lookahead <= processor.lookahead <= max_size
+            time.sleep(0.05)  # the consumer is much slower than the workers
+    finally:
+        processor.stop()
+
+
+@pytest.mark.parametrize("double_buffering", [False, True])
+def test_fused_processor_matches_processor(double_buffering):
+    # CatProcessor first: its workers are forked before Taichi is initialized
+    # in the test process by FusedCatProcessor
+    expected = take_frames(make_processor())
+
+    processor = make_processor(FusedCatProcessor, double_buffering=double_buffering)
+    assert_same_frames(take_frames(processor), expected)
+    assert processor.fps > 0
+
+
+# states of cats_data with R0 == R1 == R, there is no random hissing
+def brute_force_states(cats_data, R, distance_fun):
+    x, y = cats_data.coords.astype(float)
+    dx = np.abs(x[:, None] - x[None, :])
+    dy = np.abs(y[:, None] - y[None, :])
+    dist = [np.sqrt(dx**2 + dy**2), dx + dy, np.maximum(dx, dy)][distance_fun]
+    np.fill_diagonal(dist, np.inf)
+    expected = np.where((dist <= R).any(axis=1), BasicState.FIGHT, BasicState.WALK)
+    # states of the generator (eating, sleeping, hit cats) are kept
+    kept = cats_data.states > BasicState.FIGHT
+    expected[kept] = cats_data.states[kept]
+    return expected
+
+
+@pytest.mark.parametrize("use_shared_memory", [False, True])
+def test_reconfigure_applies_to_next_frame(use_shared_memory):
+    algorithm = CatAlgorithm(X, Y, N, 5, 5, cell_size=20)
+    generator = CatGenerator(N, 5, X, Y)
+    processor = CatProcessor(
+        algorithm, generator, use_shared_memory=use_shared_memory, algo_workers=2
+    )
+
+    # (reconfigure arguments, R and distance function of the next frames)
+    steps = [
+        ({}, 5, DistanceFunction.EUCLIDEAN),
+        ({"algo_params": {"R0": 30, "R1": 30}}, 30, DistanceFunction.EUCLIDEAN),
+        (
+            {
+                "algorithm": CatAlgorithm(
+                    X, Y, N, 12, 12, distance_fun=DistanceFunction.CHEBYSHEV
+                )
+            },
+            12,
+            DistanceFunction.CHEBYSHEV,
+        ),
+        ({"algo_params": {"R0": 3, "R1": 3}}, 3, DistanceFunction.CHEBYSHEV),
+        # the worker frees the fields of a replaced Taichi generator
+        ({"generator": TaichiCatGenerator(N, 5, X, Y)}, 3, DistanceFunction.CHEBYSHEV),
+        ({"generator": CatGenerator(N, 5, X, Y)}, 3, DistanceFunction.CHEBYSHEV),
+    ]
+
+    processor.start()
+    try:
+        for kwargs, R, distance_fun in steps:
+            if kwargs:
+                # frames of the previous configuration are in flight now
+                processor.reconfigure(**kwargs)
+            for _ in range(4):
+                cats_data = processor.data
+                expected = brute_force_states(cats_data, R, distance_fun)
+                assert np.array_equal(cats_data.states, expected)
+    finally:
+        processor.stop()
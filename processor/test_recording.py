@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from processor.processor import CatData, StateDeltaEncoder
+from processor.recording import FrameRecorder, FrameReplay
+
+
+def random_frames(N, food_count, frames, coords_dtype, states_dtype):
+    """Return (coords, states, food) of every frame, most states are kept."""
+    states = np.random.randint(1, 7, N).astype(states_dtype)
+    result = []
+    for _ in range(frames):
+        coords = np.random.randint(0, 1000, size=(2, N)).astype(coords_dtype)
+        food = np.random.randint(0, 1000, size=(2, food_count)).astype(coords_dtype)
+        states = states.copy()
+        changed = np.random.random(N) < 0.05
+        states[changed] = np.random.randint(1, 7, changed.sum())
+        result.append((coords, states, food))
+    return result
+
+
+@pytest.mark.parametrize(
+    "coords_dtype, states_dtype", [(np.uint16, np.uint8), (np.float32, np.int16)]
+)
+def test_replay_returns_recorded_frames(tmp_path, coords_dtype, states_dtype):
+    path = tmp_path / "cats.rec"
+    N, food_count, frames = 1000, 7, 12
+    expected = random_frames(N, food_count, frames, coords_dtype, states_dtype)
+
+    encoder = StateDeltaEncoder(keyframe_interval=5)
+    with FrameRecorder(path, N, food_count, coords_dtype, states_dtype) as recorder:
+        for coords, states, food in expected:
+            # keyframes and delta frames
+            delta = encoder.encode(states)
+            if delta is None:
+                recorder.write(CatData(coords, states, food))
+            else:
+                recorder.write(CatData(coords, None, food, **delta))
+
+    replay = FrameReplay(path, loop=False)
+    assert (replay.N, replay.food_count, replay.frames) == (N, food_count, frames)
+    replay.start()
+    for coords, states, food in expected:
+        cats_data = replay.data
+        assert cats_data.coords.dtype == coords_dtype
+        assert cats_data.states.dtype == states_dtype
+        assert np.array_equal(cats_data.coords, coords)
+        assert np.array_equal(cats_data.states, states)
+        assert np.array_equal(cats_data.food, food)
+
+    with pytest.raises(EOFError):
+        replay.data
+    replay.stop()
+
+
+def test_replay_of_unclosed_recording(tmp_path):
+    path = tmp_path / "crashed.rec"
+    N, food_count, frames = 500, 3, 6
+    expected = random_frames(N, food_count, frames, np.uint16, np.uint8)
+
+    recorder = FrameRecorder(path, N, food_count, np.uint16, np.uint8)
+    for coords, states, food in expected:
+        recorder.write(CatData(coords, states, food))
+    # a frame cut short by the crash
+    with open(path, "ab") as file:
+        file.write(bytes(100))
+
+    # the header still says 0 frames
+    replay = FrameReplay(path, loop=False)
+    assert replay.frames == frames
+    replay.start()
+    for coords, states, food in expected:
+        cats_data = replay.data
+        assert np.array_equal(cats_data.coords, coords)
+        assert np.array_equal(cats_data.states, states)
+        assert np.array_equal(cats_data.food, food)
+    with pytest.raises(EOFError):
+        replay.data
+
+    replay.stop()
+    recorder.close()
+
+
+def test_replay_of_empty_recording(tmp_path):
+    path = tmp_path / "empty.rec"
+    FrameRecorder(path, 100, 3).close()
+
+    replay = FrameReplay(path)
+    assert replay.frames == 0
+    replay.start()
+    with pytest.raises(EOFError):
+        replay.data
+
+
+def test_replay_rejects_other_files(tmp_path):
+    path = tmp_path / "other.rec"
+    path.write_bytes(b"NOTCATS" + bytes(4096))
+
+    with pytest.raises(ValueError):
+        FrameReplay(path)
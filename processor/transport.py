@@ -0,0 +1,95 @@
+"""Shared Memory Frame Transport for Cats App"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrameRing:
+    """
+    Ring of preallocated frame slots placed in shared memory.
+
+    Workers write cat coordinates, states and food directly into a slot,
+    so only slot indices have to travel through the processor queues.
+
+    Methods:
+        acquire(): Blocks until a free slot is available and returns its index.
+        release(slot): Returns the slot back to the ring.
+        frame(slot): Returns (coords, states, food) arrays backed by the slot.
+        close()/unlink(): Detach from / destroy the shared memory block.
+    """
+
+    def __init__(
+        self,
+        N: int,
+        food_count: int,
+        slots: int,
+        coords_dtype=int,
+        states_dtype=int,
+    ):
+        self.N = N
+        self.food_count = food_count
+        self.slots = slots
+
+        # [(name, dtype, shape of one slot)]
+        self.__layout = [
+            ("coords", np.dtype(coords_dtype), (2, N)),
+            ("states", np.dtype(states_dtype), (N,)),
+            ("food", np.dtype(coords_dtype), (2, food_count)),
+        ]
+
+        size = sum(self.__array_size(dtype, shape) for _, dtype, shape in self.__layout)
+        self.__shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+        # indices of slots which nobody writes to or reads from
+        self.__free_slots = mp.Queue()
+        for slot in range(slots):
+            self.__free_slots.put(slot)
+
+        self.__attach()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # numpy views can't be pickled together with the shared memory
+        state.pop("_SharedFrameRing__arrays")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__attach()
+
+    def acquire(self) -> int:
+        """Wait for a free slot and return its index."""
+        return self.__free_slots.get()
+
+    def release(self, slot: int):
+        """Mark the slot as free so that it can be reused for new frames."""
+        self.__free_slots.put(slot)
+
+    def frame(self, slot: int):
+        """Return coords, states and food arrays stored in the slot (no copy)."""
+        return tuple(array[slot] for array in self.__arrays.values())
+
+    def close(self):
+        """Detach current process from the shared memory."""
+        self.__arrays = {}
+        self.__shm.close()
+
+    def unlink(self):
+        """Destroy the shared memory block. Call once from the owner process."""
+        self.__shm.unlink()
+
+    def __attach(self):
+        self.__arrays = {}
+        offset = 0
+        for name, dtype, shape in self.__layout:
+            self.__arrays[name] = np.ndarray(
+                (self.slots, *shape), dtype=dtype, buffer=self.__shm.buf, offset=offset
+            )
+            offset += self.__array_size(dtype, shape)
+
+    def __array_size(self, dtype: np.dtype, shape) -> int:
+        size = self.slots * dtype.itemsize * int(np.prod(shape))
+        # keep every array 8-byte aligned
+        return (size + 7) // 8 * 8
@@ -1,32 +1,116 @@
 import pygame
 import numpy as np
-from processor.processor import CatState
-from ui.resources import catstate_to_color, catstate_to_picture, FoodState
+from ui.resources import (
+    FoodState,
+    catstate_to_picture,
+    state_pixel_colors,
+    state_rgb_colors,
+)
 
 DOT_SIZE = 1
-IMAGE_SCALE = (40, 40)
 RES = (1500, 1000)
 
-
-def draw_dot(window_surface, x_draw, y_draw, state):
-    pygame.draw.circle(
-        window_surface,
-        catstate_to_color(state),
-        (x_draw, y_draw),
-        DOT_SIZE,
+LOD_THRESHOLD = 400_000  # from this number of cats a density map is drawn
+DENSITY_TILE = 4  # size (px) of a density map tile
+
+
+class StateColors:
+    """
+    Pixel colors of cats kept between frames: given the cats whose state
+    changed (see CatData.changed) only they are recolored.
+    """
+
+    def __init__(self):
+        self.colors = None
+
+    def update(self, window_surface, states, changed=None):
+        """Set colors of `states`, without `changed` all cats are recolored."""
+        palette = state_pixel_colors(window_surface)
+        if changed is None or self.colors is None or len(self.colors) != len(states):
+            self.colors = palette[states]
+        else:
+            self.colors[changed] = palette[states[changed]]
+
+
+def draw_dots(window_surface, xs, ys, states, colors=None):
+    """Write dots of all cats straight into the surface pixels
+    (`colors` of cats in the surface format, see StateColors)."""
+    width, height = window_surface.get_size()
+    if colors is None:
+        colors = state_pixel_colors(window_surface)[states]
+
+    pixels = pygame.surfarray.pixels2d(window_surface)
+    # the same square which pygame.draw.circle draws with radius DOT_SIZE
+    for dx in range(-DOT_SIZE, DOT_SIZE):
+        for dy in range(-DOT_SIZE, DOT_SIZE):
+            pixels[np.clip(xs + dx, 0, width - 1), np.clip(ys + dy, 0, height - 1)] = (
+                colors
+            )
+    del pixels  # unlock the surface
+
+
+def draw_pictures(window_surface, xs, ys, states):
+    """Blit pictures of all cats with one blits() call per state."""
+    for state in np.unique(states):
+        mask = states == state
+        picture = catstate_to_picture(state)
+        window_surface.blits(
+            [(picture, pos) for pos in zip(xs[mask].tolist(), ys[mask].tolist())],
+            doreturn=False,
+        )
+
+
+def draw_density(window_surface, xs, ys, states):
+    """Draw cats as a heat map: every tile gets the color of its most common
+    state, brightness shows the number of cats in the tile."""
+    width, height = window_surface.get_size()
+    tiles_x, tiles_y = -(-width // DENSITY_TILE), -(-height // DENSITY_TILE)
+    colors = state_rgb_colors()
+
+    tiles = np.clip(xs // DENSITY_TILE, 0, tiles_x - 1) * tiles_y
+    tiles += np.clip(ys // DENSITY_TILE, 0, tiles_y - 1)
+
+    # number of cats in every (tile, state)
+    histogram = np.bincount(
+        tiles * len(colors) + states, minlength=tiles_x * tiles_y * len(colors)
+    ).reshape(tiles_x, tiles_y, len(colors))
+
+    counts = histogram.sum(axis=2)
+    brightness = np.log1p(counts) / np.log1p(max(counts.max(), 1))
+    heat_map = colors[histogram.argmax(axis=2)] * brightness[..., np.newaxis]
+
+    surface = pygame.surfarray.make_surface(heat_map.astype(np.uint8))
+    window_surface.blit(
+        pygame.transform.scale(
+            surface, (tiles_x * DENSITY_TILE, tiles_y * DENSITY_TILE)
+        ),
+        (0, 0),
+        special_flags=pygame.BLEND_RGB_MAX,
     )
 
 
-def draw_picture(window_surface, x_draw, y_draw, state):
-    window_surface.blit(
-        pygame.transform.scale(catstate_to_picture(state), IMAGE_SCALE),
-        (x_draw, y_draw),
-    )
+def draw_metrics(window_surface, font, metrics, render_time):
+    """Draw processor stage timings, queue sizes and render time (sec)
+    in the top right corner."""
+    lines = [
+        f"{stage}: {timings['mean_ms']:.1f} ms (last {timings['last_ms']:.1f})"
+        for stage, timings in metrics.items()
+        if stage not in ("bank_size", "lookahead")
+    ]
+    lines.append("queues: {} / {}".format(*metrics["bank_size"]))
+    if "lookahead" in metrics:
+        lines.append(f"lookahead: {metrics['lookahead']}")
+    lines.append(f"render: {render_time * 1000:.1f} ms")
+
+    width = window_surface.get_width()
+    for i, line in enumerate(lines):
+        text = font.render(line, True, (255, 255, 255), (0, 0, 0))
+        window_surface.blit(text, (width - text.get_width() - 10, 10 + i * 20))
 
 
 class DrawStyle:
-    DOTS = draw_dot
-    PICTURES = draw_picture
+    DOTS = draw_dots
+    PICTURES = draw_pictures
 
 
 def draw_cats(
@@ -38,32 +122,36 @@ def draw_cats(
     obstacles,
     food,
     draw_method,
+    lod_threshold=LOD_THRESHOLD,
+    colors=None,
 ):
+    """Draw cats with the draw method, or as a density map (see draw_density)
+    when there are at least `lod_threshold` of them. Dots take `colors` of
+    cats kept between frames (see StateColors)."""
     x1, y1 = coords1
     x2, y2 = coords2
     cx, cy = current_coords
 
-    import numpy as np
-
     # Determine whether to draw interpolated or final positions
-    delta_x = np.abs(x2 - x1) >= RES[0] // 2
-    delta_y = np.abs(y2 - y1) >= RES[1] // 2
+    # (signed difference, coordinates may be unsigned)
+    delta_x = np.abs(np.subtract(x2, x1, dtype=int)) >= RES[0] // 2
+    delta_y = np.abs(np.subtract(y2, y1, dtype=int)) >= RES[1] // 2
 
     draw_final = np.logical_or(delta_x, delta_y)
 
     x_draw = np.where(draw_final, x2, np.array(cx, dtype=int))
     y_draw = np.where(draw_final, y2, np.array(cy, dtype=int))
 
-    hit_cats_count = 0
-
-    for x, y, state in zip(x_draw, y_draw, states):
-        if state == CatState.HIT:
-            hit_cats_count += 1
-        draw_method(window_surface, int(x), int(y), state)
+    if len(states) >= lod_threshold:
+        draw_density(window_surface, x_draw, y_draw, states)
+    elif draw_method is DrawStyle.DOTS:
+        draw_dots(window_surface, x_draw, y_draw, states, colors)
+    else:
+        draw_method(window_surface, x_draw, y_draw, states)
 
-        # Draw obstacles (lines)
+    # Draw obstacles (lines)
     for start, end in obstacles:
         pygame.draw.line(window_surface, (255, 0, 0), start, end, 2)
 
-    for i in range(food.shape[1]):
-        draw_method(window_surface, int(food[0][i]), int(food[1][i]), FoodState.FOOD)
+    food_states = np.full(food.shape[1], FoodState.FOOD)
+    draw_method(window_surface, food[0].astype(int), food[1].astype(int), food_states)
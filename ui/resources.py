@@ -1,6 +1,9 @@
+import numpy as np
 import pygame
 from processor.processor import CatState
 
+IMAGE_SCALE = (40, 40)
+
 
 class FoodState(CatState):
     FOOD = 7
@@ -19,7 +22,9 @@ STATE_PICTURES = {}
 
 
 def load_picture(image_name: str):
-    return pygame.image.load(f"images/{image_name}").convert_alpha()
+    """Load an image already scaled to the size it is drawn with."""
+    picture = pygame.image.load(f"images/{image_name}").convert_alpha()
+    return pygame.transform.scale(picture, IMAGE_SCALE)
 
 
 def init_pygame_pictures():
@@ -48,3 +53,19 @@ def catstate_to_picture(state_id: int):
         f"Can't find picture for state {state_id}!"
     )
     return STATE_PICTURES[state_id]
+
+
+def state_pixel_colors(surface: pygame.Surface):
+    """Returns array which maps states to pixel values in the surface format."""
+    colors = np.zeros(max(STATE_COLORS) + 1, dtype=np.uint32)
+    for state, color in STATE_COLORS.items():
+        colors[state] = surface.map_rgb(color)
+    return colors
+
+
+def state_rgb_colors():
+    """Returns array which maps states to their (r, g, b) colors."""
+    colors = np.zeros((max(STATE_COLORS) + 1, 3), dtype=np.uint8)
+    for state, color in STATE_COLORS.items():
+        colors[state] = color
+    return colors
@@ -4,7 +4,9 @@ import math
 import os
 import sys
 
-# from time import perf_counter
+from time import perf_counter
+
+import numpy as np
 import pygame
 import pygame_gui
 
@@ -13,22 +15,34 @@ sys.path.append(os.getcwd())
 from algorithm.algorithm import CatAlgorithm, DistanceFunction
 from generator.generator import CatGenerator
 from processor.processor import CatProcessor, CatState
-from ui.cat_drawer import RES, DrawStyle, draw_cats
+from processor.recording import FrameRecorder, FrameReplay
+from ui.cat_drawer import RES, DrawStyle, StateColors, draw_cats, draw_metrics
 from ui.resources import init_pygame_pictures
 
 INTER_FRAME_NUM = 60  # Number of interpolated frames
 FPS = 60
+# compact frames: coordinates fit the window, states fit a byte
+COORDS_DTYPE = np.uint16
+STATES_DTYPE = np.uint8
 
 
-def exit_app(processor: CatProcessor):
+def exit_app(processor: CatProcessor, recorder: FrameRecorder = None):
     pygame.quit()
     if processor:
         processor.stop()
+    if recorder:
+        recorder.close()
     sys.exit()
 
 
-def run_ui():
-    """Function to run Pygame GUI"""
+def run_ui(record_path: str = None, replay_path: str = None):
+    """
+    Function to run Pygame GUI
+
+    With `record_path` every frame received from the processor is also written
+    to the file, with `replay_path` frames are played back from a recording
+    instead of being computed.
+    """
 
     pygame.init()
 
@@ -86,6 +100,7 @@ def run_ui():
         "manhattan_dist_fun": create_button("Manhattan", (151, 520), width=98),
         "chebyshev_dist_fun": create_button("Chebyshev", (252, 520), width=98),
         "quit": create_button("Quit", (50, 580)),
+        "metrics": create_button("Show metrics", (50, 640)),
     }
 
     # State Variables
@@ -93,10 +108,15 @@ def run_ui():
     is_paused = False
     current_frame = 0
     current_style = DrawStyle.PICTURES
+    show_metrics = False
+    render_time = 0.0  # seconds spent in draw_cats during the last frame
+    metrics_font = pygame.font.SysFont(None, 22)
 
     generator: CatGenerator = None
     algorithm: CatAlgorithm = None
-    processor: CatProcessor = None
+    processor: CatProcessor | FrameReplay = None
+    recorder: FrameRecorder = None
+    cats_config = None  # (number of cats, travel distance) of the running generator
 
     coords1, states1, coords2, states2, food1, food2, current_coords = (
         None,
@@ -108,6 +128,8 @@ def run_ui():
         None,
     )
     delta_dist = None
+    changed2 = None  # cats whose state differs in states2 and states1
+    state_colors = StateColors()
 
     # Obstacle variables
     obstacles = []
@@ -117,39 +139,99 @@ def run_ui():
     # Frames update
     # last_frame_time = 0
 
-    def initialize_processor(n, r, r0, r1, dist_fun=DistanceFunction.EUCLIDEAN):
-        nonlocal \
-            generator, \
-            processor, \
-            coords1, \
-            states1, \
-            coords2, \
-            states2, \
-            food1, \
-            food2, \
-            delta_dist
+    def next_frame(states=None):
+        """Return coords, states and food of the next frame and the cats whose
+        state changed (None for keyframes). Deltas are applied to a copy of the
+        previous `states`."""
+        cats_data = processor.data
+        if recorder is not None:
+            recorder.write(cats_data)
+        coords, new_states, food = cats_data.unpack()
+        if not cats_data.is_keyframe:
+            new_states = cats_data.apply(states.copy())
+        return coords, new_states, food, cats_data.changed
+
+    def load_first_frames():
+        nonlocal coords1, states1, coords2, states2, food1, food2, delta_dist
+        nonlocal changed2
+        coords1, states1, food1, _ = next_frame()
+        coords2, states2, food2, changed2 = next_frame(states1)
+        state_colors.update(window_surface, states1)
+
+        delta_dist = np.subtract(coords2, coords1, dtype=float) / INTER_FRAME_NUM
+
+    def initialize_replay():
+        nonlocal processor
+        global INTER_FRAME_NUM
+        processor = FrameReplay(replay_path)
+        INTER_FRAME_NUM = get_inter_frame_num(processor.N)
+        processor.start()
+
+        load_first_frames()
+
+    def initialize_processor(
+        n, r, r0, r1, dist_fun=DistanceFunction.EUCLIDEAN, keep_cats=False
+    ):
+        nonlocal generator, processor, recorder, cats_config
+        if keep_cats and is_running and (n, r) == cats_config:
+            # cats keep walking, only parameters of the running algorithm change
+            processor.reconfigure(
+                algo_params={"distance_fun": dist_fun, "R0": r0, "R1": r1}
+            )
+            load_first_frames()
+            return
+
+        cats_config = (n, r)
         generator = CatGenerator(n, r, *RES)
         for obstacle in obstacles:
             generator.add_bad_border(obstacle[0], obstacle[1])
         algorithm = CatAlgorithm(*RES, n, r0, r1, distance_fun=dist_fun)
-        processor = CatProcessor(algorithm, generator)
-        processor.start()
-
-        coords1, states1, food1 = processor.data.unpack()
-        coords2, states2, food2 = processor.data.unpack()
+        if is_running:
+            # running workers only receive the new configuration
+            processor.reconfigure(algorithm, generator)
+        else:
+            processor = CatProcessor(
+                algorithm,
+                generator,
+                coords_dtype=COORDS_DTYPE,
+                states_dtype=STATES_DTYPE,
+                delta_states=True,
+                # distance buttons switch between compiled kernels
+                warm_up=True,
+            )
+            processor.start()
+
+        if record_path is not None:
+            # a restarted animation overwrites the previous recording
+            if recorder is not None:
+                recorder.close()
+            recorder = FrameRecorder(
+                record_path,
+                n,
+                generator.food.shape[1],
+                coords_dtype=COORDS_DTYPE,
+                states_dtype=STATES_DTYPE,
+            )
 
-        delta_dist = (coords2 - coords1) / INTER_FRAME_NUM
+        load_first_frames()
 
-    def start_animation(dis_fun: DistanceFunction = DistanceFunction.EUCLIDEAN):
+    def start_animation(
+        dis_fun: DistanceFunction = DistanceFunction.EUCLIDEAN, keep_cats=False
+    ):
         nonlocal is_running, is_paused, current_frame, drawing_obstacles
         global INTER_FRAME_NUM
-        if is_running:
-            processor.stop()
         try:
-            n, r, r1, r0 = (int(field.get_text()) for field in input_fields)
-            INTER_FRAME_NUM = get_inter_frame_num(n)
+            if replay_path is not None:
+                if is_running:
+                    processor.stop()
+                initialize_replay()
+            else:
+                n, r, r1, r0 = (int(field.get_text()) for field in input_fields)
+                INTER_FRAME_NUM = get_inter_frame_num(n)
 
-            initialize_processor(n, r, r0, r1)
+                if is_paused:
+                    processor.resume()
+                initialize_processor(n, r, r0, r1, dis_fun, keep_cats)
 
             is_running = True
             is_paused = False
@@ -165,17 +247,25 @@ def run_ui():
         for event in pygame.event.get():
             # --- GUI BUTTONS ---
             if event.type == pygame.QUIT:
-                exit_app(processor)
+                exit_app(processor, recorder)
 
             if event.type == pygame_gui.UI_BUTTON_PRESSED:
                 if event.ui_element == buttons["quit"]:
-                    exit_app(processor)
+                    exit_app(processor, recorder)
 
                 if event.ui_element == buttons["start"]:
                     start_animation()
 
                 if event.ui_element == buttons["pause"] and is_running:
                     is_paused = not is_paused
+                    # don't compute frames nobody is going to look at
+                    if is_paused:
+                        processor.pause()
+                    else:
+                        processor.resume()
+
+                if event.ui_element == buttons["metrics"]:
+                    show_metrics = not show_metrics
 
                 # Disable "Draw obstacles" button when animation is running
                 if event.ui_element == buttons["draw_obstacles"] and not is_running:
@@ -188,13 +278,13 @@ def run_ui():
                         current_style = DrawStyle.PICTURES
                 if is_running:
                     if event.ui_element == buttons["euclidian_dist_fun"]:
-                        start_animation(DistanceFunction.EUCLIDEAN)
+                        start_animation(DistanceFunction.EUCLIDEAN, keep_cats=True)
 
                     if event.ui_element == buttons["manhattan_dist_fun"]:
-                        start_animation(DistanceFunction.MANHATTAN)
+                        start_animation(DistanceFunction.MANHATTAN, keep_cats=True)
 
                     if event.ui_element == buttons["chebyshev_dist_fun"]:
-                        start_animation(DistanceFunction.CHEBYSHEV)
+                        start_animation(DistanceFunction.CHEBYSHEV, keep_cats=True)
 
             # --- MOUSE ---
             if drawing_obstacles and not is_running:
@@ -235,6 +325,7 @@ def run_ui():
                     "Current frame can't be more than the max number of frames"
                 )
 
+            render_start = perf_counter()
             draw_cats(
                 coords1,
                 coords2,
@@ -244,15 +335,20 @@ def run_ui():
                 obstacles,
                 food1,
                 current_style,
+                colors=state_colors.colors,
             )
+            render_time = perf_counter() - render_start
 
             current_frame = current_frame + 1
             if current_frame >= INTER_FRAME_NUM:
                 current_frame = 0
                 coords1, states1, food1 = coords2, states2, food2
-                coords2, states2, food2 = processor.data.unpack()
+                state_colors.update(window_surface, states1, changed2)
+                coords2, states2, food2, changed2 = next_frame(states1)
 
-                delta_dist = (coords2 - coords1) / INTER_FRAME_NUM
+                delta_dist = (
+                    np.subtract(coords2, coords1, dtype=float) / INTER_FRAME_NUM
+                )
 
         else:
             if current_coords is not None:
@@ -265,6 +361,7 @@ def run_ui():
                     obstacles,
                     food1,
                     current_style,
+                    colors=state_colors.colors,
                 )
 
         # Redraw all obstacles after updating the window
@@ -272,6 +369,8 @@ def run_ui():
             pygame.draw.line(window_surface, (255, 0, 0), start, end, 2)
 
         pygame.display.set_caption(f"Cats  |  {math.ceil(clock.get_fps())}")
+        if show_metrics and is_running:
+            draw_metrics(window_surface, metrics_font, processor.metrics, render_time)
         manager.update(time_delta)
         manager.draw_ui(window_surface)
         pygame.display.update()